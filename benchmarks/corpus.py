@@ -0,0 +1,189 @@
+"""
+synthetic corpora for benchmarks, generated offline from a fixed seed.
+
+kinds:
+    scripts: many small scripts (20 ~ 80 lines), loosely formatted.
+    generated: one huge generated module (50k lines by default), like -
+        protobuf or api-client output.
+    imports: import-heavy files, many of the imports are unused or unsorted.
+    long_calls: files full of calls with long argument lists, which black -
+        explodes and `lkflavored.no_heavy_single_line` collapses.
+
+usage:
+    python -m benchmarks.corpus /tmp/lkfmt-corpus
+    python -m benchmarks.corpus /tmp/lkfmt-corpus --kind generated
+"""
+import os
+import random
+import typing as t
+
+from argsense import cli
+
+KINDS = ('scripts', 'generated', 'imports', 'long_calls')
+
+_modules = (
+    'os', 're', 'sys', 'json', 'time', 'random', 'typing', 'shutil',
+    'logging', 'itertools', 'functools', 'collections', 'subprocess',
+    'dataclasses', 'contextlib', 'pathlib', 'textwrap', 'hashlib',
+)  # fmt: skip
+_from_imports = {
+    'collections': ('OrderedDict', 'defaultdict', 'deque', 'namedtuple'),
+    'functools': ('lru_cache', 'partial', 'reduce', 'wraps'),
+    'os.path': ('abspath', 'basename', 'dirname', 'exists', 'join'),
+    'typing': ('Any', 'Dict', 'Iterator', 'List', 'Optional', 'Tuple'),
+}
+
+
+def generate(
+    kind: str, seed: int = 0, lines: int = 50000
+) -> t.List[t.Tuple[str, str]]:
+    """
+    params:
+        lines: only for `generated`, the size of the module.
+    returns: [(filename, code), ...]
+    """
+    rand = random.Random(f'{kind}:{seed}')
+    if kind == 'scripts':
+        return [(f'script_{i}.py', _script(rand, i)) for i in range(100)]
+    if kind == 'generated':
+        return [('generated.py', _generated(rand, lines))]
+    if kind == 'imports':
+        return [(f'imports_{i}.py', _imports(rand)) for i in range(20)]
+    if kind == 'long_calls':
+        return [(f'long_calls_{i}.py', _long_calls(rand, i)) for i in range(20)]
+    raise ValueError(kind)
+
+
+def write(kind: str, out_dir: str, **kwargs) -> t.List[str]:
+    """
+    params:
+        kwargs: see `generate`.
+    returns: paths of the written files.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    out = []
+    for name, code in generate(kind, **kwargs):
+        path = os.path.join(out_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(code)
+        out.append(path)
+    return out
+
+
+# -----------------------------------------------------------------------------
+
+
+def _script(rand: random.Random, i: int) -> str:
+    out = ['import {}'.format(x) for x in rand.sample(_modules, 3)]
+    out.append('')
+    for j in range(rand.randint(2, 6)):
+        args = ['a{}'.format(k) for k in range(rand.randint(0, 4))]
+        out.append('def func_{}_{}( {} ):'.format(i, j, ','.join(args)))
+        for k in range(rand.randint(2, 8)):
+            out.append(
+                '    x{}={}'.format(k, '+'.join(args or ['1']) + f'*{k}')
+            )
+        out.append('    if x0>1 :')
+        out.append('        return x0')
+        out.append('    return [x0,x1 ,None]')
+    out.append("if __name__=='__main__':")
+    out.append('    func_{}_0({})'.format(i, ','.join(['1'] * 4)))
+    return '\n'.join(out) + '\n'
+
+
+def _generated(rand: random.Random, lines: int) -> str:
+    out = ['# generated by a code generator, do not edit.', 'import typing']
+    i = 0
+    while len(out) < lines:
+        i += 1
+        fields = [
+            'field_{}_{}'.format(i, j) for j in range(rand.randint(2, 10))
+        ]
+        out.append('')
+        out.append('class Message{}(object):'.format(i))
+        out.append("    '''auto generated message {}.'''".format(i))
+        out.append(
+            '    __slots__=({},)'.format(','.join(repr(x) for x in fields))
+        )
+        out.append(
+            '    def __init__(self,{}):'.format(
+                ','.join(f'{x}=None' for x in fields)
+            )
+        )
+        out.extend('        self.{0}={0}'.format(x) for x in fields)
+        out.append('    def to_dict(self):')
+        out.append(
+            '        return {{{}}}'.format(
+                ','.join("'{0}':self.{0}".format(x) for x in fields)
+            )
+        )
+        out.append('    @classmethod')
+        out.append('    def from_dict(cls,d):')
+        out.append(
+            '        return cls({})'.format(
+                ','.join("{0}=d.get('{0}')".format(x) for x in fields)
+            )
+        )
+    return '\n'.join(out) + '\n'
+
+
+def _imports(rand: random.Random) -> str:
+    out = []
+    for _ in range(rand.randint(150, 300)):
+        if rand.random() < 0.5:
+            out.append('import {}'.format(rand.choice(_modules)))
+        else:
+            module = rand.choice(tuple(_from_imports))
+            names = rand.sample(_from_imports[module], rand.randint(1, 4))
+            out.append('from {} import {}'.format(module, ', '.join(names)))
+    rand.shuffle(out)
+    out.append('')
+    out.append('')
+    used = rand.sample(_modules, 5)
+    out.append('def main():')
+    out.extend('    print({}.__name__)'.format(x) for x in used)
+    return '\n'.join(out) + '\n'
+
+
+def _long_calls(rand: random.Random, i: int) -> str:
+    out = ['def main(data):']
+    for j in range(rand.randint(60, 120)):
+        args = [
+            "'argument_value_{}_{}'".format(j, k)
+            for k in range(rand.randint(2, 6))
+        ]
+        kwargs = [
+            'keyword_{}=data.get({!r}, {})'.format(k, f'key_{k}', k)
+            for k in range(rand.randint(0, 4))
+        ]
+        call = 'some_object.method_name_{}({})'.format(
+            j, ', '.join(args + kwargs)
+        )
+        if rand.random() < 0.3:
+            call = 'outer_function(inner_function({}), {})'.format(
+                call, ', '.join(args[:2])
+            )
+        out.append('    result_{} = {}'.format(j, call))
+    out.append('    return result_0')
+    return '\n'.join(out) + '\n'
+
+
+def main(out: str, kind: str = None, seed: int = 0, lines: int = 50000) -> None:
+    """
+    write corpora to disk.
+    
+    args:
+        out: output dir, each kind goes to a subdir.
+    kwargs:
+        kind: one of `scripts`, `generated`, `imports`, `long_calls`. -
+            default to all of them.
+        lines: size of the `generated` module.
+    """
+    for k in (kind,) if kind else KINDS:
+        files = write(k, os.path.join(out, k), seed=seed, lines=lines)
+        print(f'{k}: {len(files)} files')
+
+
+if __name__ == '__main__':
+    cli.add_cmd(main)
+    cli.run(main)
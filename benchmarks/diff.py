@@ -0,0 +1,109 @@
+"""
+compare the diff engines behind `stat_changes` and `show_diff`.
+
+usage:
+    python -m benchmarks.diff
+    python -m benchmarks.diff --sizes 1000,5000,20000 --ndiff-limit 5000
+
+the corpus is generated offline: the "before" side is a module indented by 2 -
+spaces, without blank lines, and with long calls in one line. the "after" -
+side is what a formatter would make of it (4 spaces indent, normalized -
+spaces, blank lines between functions, exploded calls). it's a worst case -
+for `difflib.ndiff`, since almost every line is changed and nothing can be -
+used as an anchor.
+"""
+import random
+import time
+import typing as t
+
+import lk_logger
+from argsense import cli
+
+from lkfmt import diff
+
+lk_logger.setup(quiet=True, show_funcname=False, show_varnames=False)
+
+
+def generate(lines: int, seed: int = 0) -> t.Tuple[str, str]:
+    """
+    returns: (before, after)
+    """
+    rand = random.Random(seed)
+    before = []
+    after = []
+    i = 0
+    while len(after) < lines:
+        i += 1
+        args = ['arg_{}_{}'.format(i, j) for j in range(rand.randint(1, 8))]
+        before.append('def func_{}({}) :'.format(i, ','.join(args)))
+        after.append('def func_{}({}):'.format(i, ', '.join(args)))
+        before.append('  x = {}'.format('+'.join(args)))
+        after.append('    x = {}'.format(' + '.join(args)))
+        call = 'other_function_{}({})'.format(i, ', '.join(args + ['x']))
+        before.append('  return ' + call)
+        if len(call) > 70:
+            after.append('    return other_function_{}('.format(i))
+            after.extend('        {},'.format(x) for x in args + ['x'])
+            after.append('    )')
+        else:
+            after.append('    return ' + call)
+        after.append('')
+        after.append('')
+    return '\n'.join(before), '\n'.join(after)
+
+
+def count(a: str, b: str, engine: str) -> diff.T.Changes:
+    insertions = updates = deletions = 0
+    for mark, _ in diff._squirsh_diffs(
+        diff._diff(a.splitlines(), b.splitlines(), engine)
+    ):
+        if mark == '+':
+            insertions += 1
+        elif mark == '-':
+            deletions += 1
+        elif mark == '?':
+            updates += 1
+    return insertions, updates, deletions
+
+
+def main(sizes: str = '500,2000,5000,20000', ndiff_limit: int = 5000) -> None:
+    """
+    kwargs:
+        sizes: comma separated line numbers of generated files.
+        ndiff_limit: skip the ndiff engine for files larger than this, it -
+            grows quadratically.
+    """
+    print(
+        '{:>7}  {:>10}  {:>10}  {:>8}  {}'.format(
+            'lines', 'ndiff(s)', 'fast(s)', 'speedup', 'counts (i, u, d)'
+        )
+    )
+    for size in map(int, sizes.split(',')):
+        a, b = generate(size)
+        start = time.perf_counter()
+        fast = count(a, b, 'fast')
+        t_fast = time.perf_counter() - start
+        if size <= ndiff_limit:
+            start = time.perf_counter()
+            slow = count(a, b, 'ndiff')
+            t_slow = time.perf_counter() - start
+            print(
+                '{:>7}  {:>10.3f}  {:>10.3f}  {:>7.1f}x  {}'.format(
+                    size,
+                    t_slow,
+                    t_fast,
+                    t_slow / t_fast,
+                    fast if fast == slow else f'{fast} != ndiff {slow}',
+                )
+            )
+        else:
+            print(
+                '{:>7}  {:>10}  {:>10.3f}  {:>8}  {}'.format(
+                    size, '-', t_fast, '-', fast
+                )
+            )
+
+
+if __name__ == '__main__':
+    cli.add_cmd(main)
+    cli.run(main)
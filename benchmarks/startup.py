@@ -0,0 +1,134 @@
+"""
+startup-time benchmark, based on `python -X importtime`.
+
+usage:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --top 20
+
+for every scenario we report the wall time, the accumulated import time, and -
+which heavy formatter modules got imported. the "heavy" column should stay -
+empty for all scenarios except the last one.
+"""
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import typing as t
+
+from argsense import cli
+
+HEAVY_MODULES = ('autoflake', 'autopep8', 'black', 'isort', 'libcst', 'yapf')
+
+_sample_code = '''\
+import os
+
+
+def foo(a, b):
+    return os.path.join(a, b)
+'''
+_project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_re_importtime = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+class ImportRecord(t.NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def get_scenarios(tmpdir: str) -> t.Dict[str, str]:
+    return {
+        'import lkfmt': 'import lkfmt',
+        'daemon client': 'import lkfmt.__main__',
+        'cli (-h)': 'import lkfmt.cli',
+        'no-op run (cached)': (
+            'from lkfmt.formatter import fmt_all; fmt_all({!r})'.format(tmpdir)
+        ),
+        'full run': (
+            'from lkfmt.formatter import fmt_all; '
+            'fmt_all({!r}, no_cache=True)'.format(tmpdir)
+        ),
+    }
+
+
+def measure(stmt: str) -> t.Tuple[float, t.List[ImportRecord]]:
+    """
+    returns: (wall_time_in_seconds, import_records)
+    """
+    start = time.perf_counter()
+    proc = subprocess.run(
+        (sys.executable, '-X', 'importtime', '-c', stmt),
+        cwd=_project_root,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr)
+    records = []
+    for line in proc.stderr.splitlines():
+        if m := _re_importtime.match(line):
+            records.append(
+                ImportRecord(
+                    module=m.group(4),
+                    self_us=int(m.group(1)),
+                    cumulative_us=int(m.group(2)),
+                    depth=len(m.group(3)) // 2,
+                )
+            )
+    return wall, records
+
+
+def main(top: int = 5, repeat: int = 3) -> None:
+    """
+    kwargs:
+        top: show the top N slowest modules (by self time) for each scenario.
+        repeat: run each scenario N times and keep the fastest.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(os.path.join(tmpdir, 'sample.py'), 'w') as f:
+            f.write(_sample_code)
+        scenarios = get_scenarios(tmpdir)
+        # warm up the cache for "no-op run".
+        measure(scenarios['no-op run (cached)'])
+        
+        print(
+            '{:<20} {:>9} {:>9}  {}'.format(
+                'scenario', 'wall(ms)', 'import', 'heavy'
+            )
+        )
+        details = {}
+        for name, stmt in scenarios.items():
+            wall, records = min(
+                (measure(stmt) for _ in range(repeat)), key=lambda x: x[0]
+            )
+            toplevel = [x for x in records if x.depth == 0]
+            heavy = sorted(
+                {x.module for x in toplevel if x.module in HEAVY_MODULES}
+            )
+            print(
+                '{:<20} {:>9.1f} {:>9.1f}  {}'.format(
+                    name,
+                    wall * 1000,
+                    sum(x.cumulative_us for x in toplevel) / 1000,
+                    ', '.join(heavy) or '-',
+                )
+            )
+            details[name] = sorted(
+                records, key=lambda x: x.self_us, reverse=True
+            )[:top]
+    
+    if top:
+        for name, records in details.items():
+            print(f'\n{name}:')
+            for r in records:
+                print(f'    {r.self_us / 1000:>8.1f} ms  {r.module}')
+
+
+if __name__ == '__main__':
+    cli.add_cmd(main)
+    cli.run(main)
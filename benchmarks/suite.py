@@ -0,0 +1,347 @@
+"""
+benchmark suite for the whole formatting pipeline.
+
+usage:
+    python -m benchmarks.suite
+    python -m benchmarks.suite --quick
+    python -m benchmarks.suite --save baseline.json
+    python -m benchmarks.suite --compare-with baseline.json
+
+measurements:
+    startup/*: cold-start time of `import lkfmt` and `lkfmt -h` (see -
+        `benchmarks.startup`).
+    pipeline/<kind>: `fmt_one` over a corpus (see `benchmarks.corpus`), in a -
+        fresh process. reports seconds, files/s, lines/s and peak rss.
+    blocks/rerun: re-format a large generated module after one top-level -
+        block is changed, with the block table of the first run (see -
+        `lkfmt.blocks`).
+    lkflavored/<rule>: each registered rule on its own, over black-formatted -
+        corpora.
+    diff/*: `stat_changes` and `show_diff` on the (origin, formatted) pairs, -
+        plus the worst case from `benchmarks.diff`.
+
+`--compare-with` exits with code 1 if any measurement is slower (or uses more -
+memory) than the baseline by more than `--threshold`.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import typing as t
+
+import lk_logger
+from argsense import cli
+
+from . import corpus
+from . import diff as diff_bench
+from . import startup
+
+lk_logger.setup(quiet=True, show_funcname=False, show_varnames=False)
+
+_project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class T:
+    # {'seconds': float, ...other metrics}
+    Result = t.Dict[str, float]
+    Results = t.Dict[str, Result]
+
+
+def run_startup(repeat: int) -> T.Results:
+    stmts = {
+        'startup/import lkfmt': 'import lkfmt',
+        'startup/cli': 'import lkfmt.cli',
+    }
+    return {
+        name: {'seconds': min(startup.measure(stmt)[0] for _ in range(repeat))}
+        for name, stmt in stmts.items()
+    }
+
+
+def run_pipeline(kind: str, corpus_dir: str, repeat: int) -> T.Result:
+    """
+    run `fmt_one` over a corpus in fresh processes, keep the fastest run.
+    """
+    out = None
+    for _ in range(repeat):
+        proc = subprocess.run(
+            (
+                sys.executable,
+                '-c',
+                (
+                    'import json, sys; from benchmarks.suite import'
+                    ' _pipeline_worker; sys.stdout.write(json.dumps('
+                    '_pipeline_worker(sys.argv[1])))'
+                ),
+                os.path.join(corpus_dir, kind),
+            ),
+            cwd=_project_root,
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr)
+        result = json.loads(proc.stdout)
+        if out is None or result['seconds'] < out['seconds']:
+            out = result
+    return out
+
+
+def run_block_cache(lines: int, repeat: int) -> T.Result:
+    from lkfmt import formatter
+    
+    file = 'generated.py'
+    _, code = corpus.generate('generated', lines=lines)[0]
+    formatter.warmup()
+    formatter._fmt_code(code, file, 'black')  # fills the block table.
+    table = formatter._cache.get_blocks(file)
+    middle = code.index('\nclass ', len(code) // 2)
+    edited = code[:middle] + '\nCONSTANT = 1\n' + code[middle:]
+    
+    def rerun() -> None:
+        # every run starts from the table of the first run.
+        formatter._cache.set_blocks(file, table)
+        formatter._fmt_code(edited, file, 'black')
+    
+    return {'seconds': _best_of(rerun, repeat)}
+
+
+def run_lkflavored(samples: t.List[str], repeat: int) -> T.Results:
+    from lkfmt import lkflavored as lkf
+    
+    out = {}
+    for name in lkf._rules:
+        best = float('inf')
+        for _ in range(repeat):
+            lkf._heavy_line_memo.clear()
+            start = time.perf_counter()
+            for code in samples:
+                lkf.apply(code, rules=(name,))
+            best = min(best, time.perf_counter() - start)
+        out[f'lkflavored/{name}'] = {'seconds': best}
+    return out
+
+
+def run_diff(pairs: t.List[t.Tuple[str, str]], repeat: int) -> T.Results:
+    from lkfmt.diff import show_diff
+    from lkfmt.diff import stat_changes
+    
+    def stat_all() -> None:
+        for a, b in pairs:
+            stat_changes(a, b)
+    
+    def show_all() -> None:
+        lk_logger.mute()
+        try:
+            for a, b in pairs:
+                show_diff(a, b)
+        finally:
+            lk_logger.unmute()
+    
+    worst_case = diff_bench.generate(2000)
+    return {
+        'diff/stat_changes': {'seconds': _best_of(stat_all, repeat)},
+        'diff/show_diff': {'seconds': _best_of(show_all, repeat)},
+        'diff/worst_case_2k': {
+            'seconds': _best_of(
+                lambda: diff_bench.count(*worst_case, 'fast'), repeat
+            )
+        },
+    }
+
+
+def compare(
+    results: T.Results, baseline: dict, threshold: float
+) -> t.List[str]:
+    """
+    print results side by side with the baseline.
+    
+    returns: names of the regressed measurements.
+    """
+    if baseline.get('env') != _get_env():
+        print(
+            '[yellow]the baseline is recorded in a different environment: '
+            '{}[/]'.format(baseline.get('env')),
+            ':r',
+        )
+    print(
+        '{:<40} {:>10} {:>10} {:>8}'.format(
+            'measurement', 'now', 'baseline', 'change'
+        )
+    )
+    regressions = []
+    for name, result in results.items():
+        for metric in ('seconds', 'peak_rss_mb'):
+            if metric not in result:
+                continue
+            now = result[metric]
+            old = baseline['results'].get(name, {}).get(metric)
+            label = name if metric == 'seconds' else f'{name} (rss)'
+            if not old:
+                print(
+                    '{:<40} {:>10.3f} {:>10} {:>8}'.format(
+                        label, now, '-', '-'
+                    )
+                )
+                continue
+            change = now / old - 1
+            if change > threshold:
+                regressions.append(label)
+                color = 'red'
+            elif change < -threshold:
+                color = 'green'
+            else:
+                color = 'dim'
+            print(
+                ':r',
+                '{:<40} {:>10.3f} {:>10.3f} [{}]{:>+7.1f}%[/]'.format(
+                    label, now, old, color, change * 100
+                ),
+            )
+    return regressions
+
+
+def main(
+    save: str = None,
+    compare_with: str = None,
+    threshold: float = 0.1,
+    repeat: int = 3,
+    quick: bool = False,
+) -> None:
+    """
+    kwargs:
+        save: save results to a json file, as the baseline for later runs.
+        compare_with (-c): compare results with a baseline json file, exit -
+            with code 1 if there is any regression.
+        threshold: relative change (0.1 = 10%) above which a measurement is -
+            reported as regression.
+        repeat: run each measurement N times and keep the fastest.
+        quick: a smaller `generated` corpus (5k lines instead of 50k) and -
+            one run per measurement. for a smoke test, not for baselines.
+    """
+    if quick: repeat = 1
+    lines = 5000 if quick else 50000
+    
+    results: T.Results = {}
+    results.update(run_startup(repeat))
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for kind in corpus.KINDS:
+            corpus.write(kind, os.path.join(tmpdir, kind), lines=lines)
+            results[f'pipeline/{kind}'] = run_pipeline(kind, tmpdir, repeat)
+            print(f'[dim]pipeline/{kind} done[/]', ':r')
+    results['blocks/rerun'] = run_block_cache(lines // 5, repeat)
+    
+    # the huge generated module is left out below, black alone takes minutes -
+    # on it, and `pipeline/generated` already covers it.
+    origins = [
+        code
+        for kind in corpus.KINDS
+        if kind != 'generated'
+        for _, code in corpus.generate(kind)
+    ]
+    formatted = [_black(x) for x in origins]
+    results.update(run_lkflavored(formatted, repeat))
+    results.update(run_diff(list(zip(origins, formatted)), repeat))
+    
+    if compare_with:
+        with open(compare_with, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, threshold)
+    else:
+        regressions = []
+        print('{:<40} {:>10}  {}'.format('measurement', 'seconds', 'details'))
+        for name, result in results.items():
+            print(
+                '{:<40} {:>10.3f}  {}'.format(
+                    name,
+                    result['seconds'],
+                    ', '.join(
+                        f'{k}={v:.1f}'
+                        for k, v in result.items()
+                        if k != 'seconds'
+                    ),
+                )
+            )
+    
+    if save:
+        with open(save, 'w', encoding='utf-8') as f:
+            json.dump(
+                {'version': 1, 'env': _get_env(), 'results': results},
+                f,
+                indent=2,
+            )
+        print(f'[green]results saved to {save}[/]', ':r')
+    if regressions:
+        print(f'[red]{len(regressions)} regressions: {regressions}[/]', ':r')
+        sys.exit(1)
+
+
+# -----------------------------------------------------------------------------
+
+
+def _pipeline_worker(corpus_dir: str) -> T.Result:
+    import resource
+    
+    from lkfmt.formatter import fmt_one
+    from lkfmt.formatter import warmup
+    
+    warmup()
+    files = sorted(os.path.join(corpus_dir, x) for x in os.listdir(corpus_dir))
+    lines = 0
+    for f in files:
+        with open(f, encoding='utf-8') as fh:
+            lines += fh.read().count('\n')
+    start = time.perf_counter()
+    for f in files:
+        fmt_one(f, inplace=False, quiet=True)
+    seconds = time.perf_counter() - start
+    return {
+        'seconds': seconds,
+        'files_per_s': len(files) / seconds,
+        'lines_per_s': lines / seconds,
+        # linux reports kilobytes, macos bytes.
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (
+            1024 * 1024 if sys.platform == 'darwin' else 1024
+        ),
+    }
+
+
+def _best_of(func: t.Callable[[], t.Any], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _black(code: str) -> str:
+    import black
+    
+    from lkfmt import settings
+    
+    return black.format_str(code, mode=black.Mode(**settings.BLACK))
+
+
+def _get_env() -> t.Dict[str, str]:
+    from importlib.metadata import version
+    
+    from lkfmt import __version__
+    
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(terse=True),
+        'lkfmt': __version__,
+        **{x: version(x) for x in ('black', 'isort', 'autoflake')},
+    }
+
+
+if __name__ == '__main__':
+    # registered here rather than by decorator, benchmark modules import -
+    # each other and would clash on the command name.
+    cli.add_cmd(main)
+    cli.run(main)
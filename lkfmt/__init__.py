@@ -1,7 +1,32 @@
-from .diff import show_diff
-from .diff import stat_changes
-from .formatter import fmt_all
-from .formatter import fmt_one
-from .formatter import fmt_one as fmt_file
+import typing as t
+
+if t.TYPE_CHECKING:
+    from .diff import show_diff
+    from .diff import stat_changes
+    from .formatter import fmt_all
+    from .formatter import fmt_code
+    from .formatter import fmt_one
+    from .formatter import fmt_one as fmt_file
 
 __version__ = '0.3.0'
+
+# the formatters are heavy to import. we load them only when they are -
+# actually accessed, so that the daemon client (see `__main__._shortcut`) -
+# stays fast.
+_lazy_attrs = {
+    'fmt_all': ('formatter', 'fmt_all'),
+    'fmt_code': ('formatter', 'fmt_code'),
+    'fmt_file': ('formatter', 'fmt_one'),
+    'fmt_one': ('formatter', 'fmt_one'),
+    'show_diff': ('diff', 'show_diff'),
+    'stat_changes': ('diff', 'stat_changes'),
+}
+
+
+def __getattr__(name: str) -> t.Any:
+    if name in _lazy_attrs:
+        from importlib import import_module
+        
+        module, attr = _lazy_attrs[name]
+        return getattr(import_module('.' + module, __name__), attr)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
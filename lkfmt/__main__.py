@@ -1,30 +1,93 @@
-from argsense import cli
-from lk_utils import loads
+import io
+import sys
+import typing as t
 
-from . import diff
-from .formatter import fmt_all
-from .formatter import fmt_one
+# keep module level imports light here, the heavy cli is loaded only when the -
+# daemon client cannot handle the command. see `_shortcut`.
+from . import daemon
 
-cli.add_cmd(fmt_all, name='fmt')
-
-
-@cli.cmd()
-def show_diff(file: str) -> None:
-    src_code = loads(file, 'plain')
-    dst_code, _ = fmt_one(file, inplace=False, quiet=False)
-    diff.show_diff(src_code, dst_code)
-    diff.stat_changes(src_code, dst_code, verbose=True)
+_subcommands = (
+    'bench-backends',
+    'cache',
+    'daemon',
+    'fmt',
+    'merge-reports',
+    'show-diff',
+    'watch',
+)
 
 
 def _shortcut() -> None:
     """
     poetry build to be executable script.
     """
+    argv = sys.argv[1:]
+    if argv[:1] == ['-']:
+        sys.exit(_run_stdin(argv[1:]))
+    if argv and argv[0] in _subcommands:
+        from .cli import cli
+        
+        cli.run()
+        return
+    if (code := daemon.run_client(argv)) is not None:
+        sys.exit(code)
+    from .cli import cli
+    from .cli import fmt_all
+    
     cli.run(fmt_all)
 
 
+def _run_stdin(argv: t.List[str]) -> int:
+    """
+    `lkfmt - [--stdin-filename <name>] [--check]`
+    
+    read code from stdin and write the formatted code to stdout, nothing on -
+    disk is touched. with `--check`, nothing is written, the exit code is 1 -
+    if the code would be changed.
+    argsense doesn't accept `-` as an argument, so we parse the options here.
+    """
+    filename = '<stdin>.py'
+    check = False
+    args = iter(argv)
+    for arg in args:
+        if arg == '--stdin-filename':
+            filename = next(args, filename)
+        elif arg == '--check':
+            check = True
+        else:
+            sys.stderr.write(f'lkfmt: unknown option in stdin mode: {arg}\n')
+            return 2
+    
+    code = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8').read()
+    if (resp := daemon.request_fmt_code(code, filename)) is not None:
+        if not resp['ok']:
+            sys.stderr.write('lkfmt daemon: {}\n'.format(resp['error']))
+            return 1
+        new_code = resp['code']
+    else:
+        import lk_logger
+        
+        from .formatter import _fmt_code
+        
+        # stdout is for the code only.
+        lk_logger.mute()
+        new_code = _fmt_code(code, filename, 'black')
+    
+    if check:
+        return int(new_code != code)
+    sys.stdout.buffer.write(new_code.encode('utf-8'))
+    return 0
+
+
 if __name__ == '__main__':
     # pox -m lkfmt -h
     # pox -m lkfmt fmt $file
     # pox -m lkfmt show-diff $file
+    # pox -m lkfmt daemon
+    # pox -m lkfmt watch $dir
+    # pox -m lkfmt - < $file
+    if sys.argv[1:2] == ['-']:
+        sys.exit(_run_stdin(sys.argv[2:]))
+    from .cli import cli
+    
     cli.run()
@@ -0,0 +1,217 @@
+"""
+the main formatters of the pipeline (the stage after isort), as named -
+backends.
+
+a backend is built by its factory once per process: the formatter is -
+imported and its options (`black.Mode`, the yapf style, the autopep8 -
+namespace) are resolved there, the function it returns only formats.
+
+the built-in backends are autopep8, black and yapf. more can be registered -
+with `register_backend`, or by another package through the `lkfmt.backends` -
+entry point group, so they work from the command line too. e.g. in its -
+`pyproject.toml`:
+    [project.entry-points."lkfmt.backends"]
+    ruff = "my_package.lkfmt_ruff"
+an entry point is loaded the first time its name is asked for, importing the -
+module is supposed to register the backend.
+
+this module must stay cheap to import (no formatter is imported at module -
+level), the cache fingerprint reads the options of a backend before any -
+formatter is loaded.
+"""
+import time
+import typing as t
+from functools import lru_cache
+
+from lk_utils import fs
+
+from . import settings
+
+
+class T:
+    # (code, file) -> code. the file is a hint, nothing is read from it.
+    Format = t.Callable[[str, str], str]
+    Factory = t.Callable[[], Format]
+
+
+class Backend(t.NamedTuple):
+    factory: T.Factory
+    # anything that affects the output, it takes part in the cache key.
+    options: t.Any
+    # distribution names, their versions take part in the cache key.
+    packages: t.Tuple[str, ...]
+
+
+class BenchResult(t.NamedTuple):
+    # seconds to import the formatter and build its options.
+    setup: float
+    # seconds spent in formatting, failed files included.
+    seconds: float
+    files: int
+    lines: int
+    failures: int
+
+
+_backends: t.Dict[str, Backend] = {}
+_entry_points_loaded = False
+
+
+def register_backend(
+    name: str, options: t.Any = None, packages: t.Iterable[str] = None
+) -> t.Callable[[T.Factory], T.Factory]:
+    """
+    register a backend factory. for example:
+        @register_backend('ruff', {'line_length': 80}, ('ruff',))
+        def _ruff():
+            import ruff_api
+            options = ruff_api.FormatOptions(line_width=80)
+            return lambda code, file: ruff_api.format_string(
+                file, code, options
+            )
+    
+    params:
+        options: the options of the backend, any value with a stable `repr`. -
+            change it when the output would change, so the cache is not -
+            reused.
+        packages: default to `(name,)`.
+    """
+    
+    def decorator(factory: T.Factory) -> T.Factory:
+        _backends[name] = Backend(
+            factory, options, (name,) if packages is None else tuple(packages)
+        )
+        get.cache_clear()
+        return factory
+    
+    return decorator
+
+
+@lru_cache()
+def get(name: str) -> T.Format:
+    """
+    the format function of a backend, built on first use.
+    """
+    return _lookup(name).factory()
+
+
+def names() -> t.List[str]:
+    _load_entry_points()
+    return sorted(_backends)
+
+
+def options(name: str) -> t.Any:
+    return _lookup(name).options
+
+
+def packages(name: str) -> t.Tuple[str, ...]:
+    return _lookup(name).packages
+
+
+def bench(codes: t.Dict[str, str], name: str) -> BenchResult:
+    """
+    format every code by a backend, in the current process.
+    
+    params:
+        codes: dict[file, code]. the same sources are given to every backend -
+            for a fair comparison.
+    """
+    start = time.perf_counter()
+    format = get(name)
+    setup = time.perf_counter() - start
+    failures = 0
+    start = time.perf_counter()
+    for file, code in codes.items():
+        try:
+            format(code, file)
+        except Exception:
+            failures += 1
+    return BenchResult(
+        setup,
+        time.perf_counter() - start,
+        len(codes),
+        sum(x.count('\n') for x in codes.values()),
+        failures,
+    )
+
+
+@lru_cache()
+def black_mode() -> 'black.Mode':
+    import black
+    
+    return black.Mode(**settings.BLACK)
+
+
+def _load_entry_points(name: str = None) -> None:
+    """
+    params:
+        name: only load the entry points of this name. none means all.
+    """
+    global _entry_points_loaded
+    if _entry_points_loaded: return
+    from importlib.metadata import entry_points
+    
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group='lkfmt.backends')
+    else:  # python < 3.10 returns a dict of groups.
+        eps = eps.get('lkfmt.backends', [])
+    for ep in eps:
+        if name is None or ep.name == name:
+            ep.load()
+    if name is None:
+        _entry_points_loaded = True
+
+
+def _lookup(name: str) -> Backend:
+    if name not in _backends:
+        _load_entry_points(name)
+    try:
+        return _backends[name]
+    except KeyError:
+        raise ValueError(
+            'unknown backend: {}, expect one of: {}'.format(
+                name, ', '.join(names())
+            )
+        )
+
+
+# -----------------------------------------------------------------------------
+# built-in backends
+
+
+@register_backend('autopep8', settings.AUTOPEP8)
+def _autopep8() -> T.Format:
+    import autopep8
+    
+    # `autopep8.fix_code` parses a dict of options (with argparse) on every -
+    # call, a namespace is used as is.
+    options = autopep8.parse_args([''])
+    for k, v in settings.AUTOPEP8.items():
+        setattr(options, k, v)
+    return lambda code, file: autopep8.fix_code(
+        code, encoding='utf-8', options=options
+    )
+
+
+@register_backend('black', settings.BLACK)
+def _black() -> T.Format:
+    import black
+    
+    mode = black_mode()
+    return lambda code, file: black.format_str(code, mode=mode)
+
+
+@register_backend('yapf', settings.YAPF)
+def _yapf() -> T.Format:
+    from yapf.yapflib import style
+    from yapf.yapflib import yapf_api
+    
+    # `FormatCode` builds the style from a dict on every call, but a None -
+    # `style_config` takes the global style, which we set to a prebuilt one.
+    prebuilt = style.CreateStyleFromConfig(settings.YAPF)
+    
+    def format(code: str, file: str) -> str:
+        style.SetGlobalStyle(prebuilt)
+        return yapf_api.FormatCode(code, filename=fs.filename(file))[0]
+    
+    return format
@@ -0,0 +1,247 @@
+"""
+block cache for black on large modules.
+
+a module is split into segments, one per top-level statement (see -
+`ranges.top_level_blocks`), each one taking the comments and blank lines -
+before it. black's output for a segment only depends on:
+    - the segment itself.
+    - the previous segment, which decides the blank lines in between. we -
+        format a segment behind the formatted previous one and cut it off -
+        afterwards.
+    - the target versions, which black infers from the whole module. we -
+        infer them per segment and intersect, then pin them in the mode.
+so the formatted segments can be cached by these three, and on a re-run -
+only the new or changed segments (plus the ones right after) go through -
+black.
+
+the first run of a module formats it as a whole, then cuts the output into -
+segments to fill the cache, so it's barely slower than plain black.
+"""
+import ast
+import typing as t
+from dataclasses import replace
+
+from . import ranges
+from .cache import _hash
+
+if t.TYPE_CHECKING: import black
+
+# smaller modules are formatted as a whole, the split doesn't pay off.
+MIN_LINES = 1000
+# if less than this ratio of segments have been seen before, format the module -
+# as a whole.
+_WARM_RATIO = 0.75
+# set to the error when black's internals used by `_detect_versions` are -
+# missing (they are not public api). the cache is off from then on.
+_unsupported: t.Optional[str] = None
+
+
+class T:
+    # dict[key, code]. keys of both per-segment target versions and formatted -
+    #   segments. see `format_str`.
+    Table = t.Dict[str, str]
+
+
+class _Fallback(Exception):
+    pass
+
+
+def format_str(
+    code: str, mode: 'black.Mode', table: T.Table, salt: str = ''
+) -> t.Tuple[str, T.Table]:
+    """
+    the same as `black.format_str(code, mode=mode)`, but reuses the formatted -
+    segments in `table`.
+    
+    params:
+        table: the one returned by the last call for the same file, or an -
+            empty dict.
+        salt: mixed into the keys, e.g. the cache fingerprint.
+    returns: (code, new_table)
+        new_table only holds the entries used by this call, so it doesn't -
+        grow with the edits of a file.
+    """
+    import black
+    
+    if _unsupported:
+        return black.format_str(code, mode=mode), {}
+    try:
+        segments, counts = _split(code)
+    except _Fallback:
+        return black.format_str(code, mode=mode), {}
+    
+    new_table = {}
+    seen = 0
+    versions = set(black.TargetVersion)
+    for seg in segments:
+        key = _hash(f'{salt}:versions:{seg}')
+        if key in table:
+            seen += 1
+            names = table[key]
+        else:
+            try:
+                names = _detect_versions(seg)
+            except (ImportError, AttributeError) as e:
+                _disable(e)
+                return black.format_str(code, mode=mode), {}
+            except Exception:
+                # e.g. a segment that black can't parse on its own.
+                return black.format_str(code, mode=mode), {}
+        new_table[key] = names
+        versions &= {black.TargetVersion[x] for x in names.split(',') if x}
+    if not versions:
+        return black.format_str(code, mode=mode), {}
+    mode = replace(mode, target_versions=versions)
+    prefix = '{}:{}'.format(salt, ','.join(sorted(x.name for x in versions)))
+    
+    if seen < len(segments) * _WARM_RATIO:
+        out = black.format_str(code, mode=mode)
+        for key, seg_out in _cut(out, segments, counts, prefix):
+            new_table[key] = seg_out
+        return out, new_table
+    
+    out = []
+    ctx = ''
+    for seg in segments:
+        key = _hash(f'{prefix}:{_hash(ctx)}:{seg}')
+        if key in table:
+            seg_out = table[key]
+        else:
+            full = black.format_str(ctx + seg, mode=mode)
+            if not full.startswith(ctx):
+                return black.format_str(code, mode=mode), {}
+            seg_out = full[len(ctx) :]
+        new_table[key] = seg_out
+        out.append(seg_out)
+        ctx = seg_out.lstrip('\n')
+    return ''.join(out), new_table
+
+
+def _split(code: str) -> t.Tuple[t.List[str], t.List[int]]:
+    """
+    split the module into segments, each one ends with a top-level statement -
+    and takes the comments and blank lines before it. trailing comments at -
+    the end of the module go to the last segment.
+    
+    a bare string statement (other than the module docstring) is kept with -
+    the next one: black takes the first string of a module as the docstring, -
+    it would be formatted differently as the context of the next segment.
+    
+    returns: (segments, counts)
+        counts: how many top-level statements each segment has.
+    raises: `_Fallback` if the module can't be split.
+    """
+    if 'fmt: off' in code or 'fmt:off' in code:
+        # a `fmt: off` region may span several segments.
+        raise _Fallback
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        raise _Fallback
+    ends = []
+    counts = []
+    glue = False
+    for i, (node, (start, end)) in enumerate(_spans(tree)):
+        if ends and (glue or start <= ends[-1]):
+            ends[-1] = max(end, ends[-1])
+            counts[-1] += 1
+        else:
+            ends.append(end)
+            counts.append(1)
+        glue = i > 0 and _is_string_stmt(node)
+    if len(ends) < 2:
+        raise _Fallback
+    return _cut_lines(code, ends), counts
+
+
+def _cut(
+    out: str, segments: t.List[str], counts: t.List[int], prefix: str
+) -> t.Iterator[t.Tuple[str, str]]:
+    """
+    cut the formatted module into the formatted segments.
+    black keeps the top-level statements, so the i-th segment of the output -
+    ends with the last statement of the i-th input segment.
+    
+    yields: (key, formatted_segment)
+        nothing is yielded if the output doesn't match the input.
+    """
+    try:
+        spans = [span for _, span in _spans(ast.parse(out))]
+    except (SyntaxError, ValueError):
+        return
+    if len(spans) != sum(counts): return
+    ends = []
+    i = 0
+    for n in counts:
+        i += n
+        end = spans[i - 1][1]
+        if ends and end <= ends[-1] or i < len(spans) and spans[i][0] <= end:
+            return  # two segments would share a line.
+        ends.append(end)
+    ctx = ''
+    for seg, seg_out in zip(segments, _cut_lines(out, ends)):
+        yield _hash(f'{prefix}:{_hash(ctx)}:{seg}'), seg_out
+        ctx = seg_out.lstrip('\n')
+
+
+def _cut_lines(code: str, ends: t.List[int]) -> t.List[str]:
+    """
+    params:
+        ends: the last line number (1-based) of each segment. the last -
+            segment always extends to the end of the code.
+    """
+    lines = ranges._split_lines(code)
+    out = []
+    pos = 0
+    for end in ends[:-1]:
+        out.append(''.join(lines[pos:end]))
+        pos = end
+    out.append(''.join(lines[pos:]))
+    return out
+
+
+def _detect_versions(segment: str) -> str:
+    """
+    returns: comma separated names of `black.TargetVersion`.
+    """
+    import black
+    from black.parsing import lib2to3_parse
+    
+    node = lib2to3_parse(segment.lstrip())
+    return ','.join(
+        sorted(
+            x.name
+            for x in black.detect_target_versions(
+                node, future_imports=black.get_future_imports(node)
+            )
+        )
+    )
+
+
+def _disable(e: Exception) -> None:
+    global _unsupported
+    _unsupported = f'{type(e).__name__}: {e}'
+    print(
+        '[yellow]block cache is disabled, this version of black is not '
+        'supported ({})[/]'.format(_unsupported),
+        ':r',
+    )
+
+
+def _is_string_stmt(node: ast.stmt) -> bool:
+    return (
+        isinstance(node, ast.Expr) and
+        isinstance(node.value, ast.Constant) and
+        isinstance(node.value.value, str)
+    )  # fmt:skip
+
+
+def _spans(tree: ast.Module) -> t.Iterator[t.Tuple[ast.stmt, ranges.T.Range]]:
+    for node in tree.body:
+        start = min(
+            (
+                node.lineno,
+                *(x.lineno for x in getattr(node, 'decorator_list', ())),
+            )
+        )
+        yield node, (start, node.end_lineno)
@@ -0,0 +1,457 @@
+"""
+the formatting cache, stored in a sqlite database per project.
+
+the database is at `<project>/.lkfmt_cache/cache.db`, where the project is -
+the nearest parent dir (of the target) with a `.git`, `pyproject.toml` etc. -
+set env var `LKFMT_CACHE_DIR` to use another dir, e.g. one shared by all -
+projects, or restored from a ci artifact.
+
+several lkfmt processes (parallel pre-commit hooks, editor saves...) may use -
+the same database at the same time: it's in wal mode, and each process only -
+merges its new records into it, nothing is overwritten as a whole.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import typing as t
+from functools import lru_cache
+
+from lk_utils import fs
+
+from . import backends
+from . import settings
+
+_CACHE_VERSION = 4
+# the modules of lkfmt that decide the formatted output. `__version__` is not -
+# bumped for every change of our own rules, so their sources take part in the -
+# fingerprint instead.
+_PIPELINE_SOURCES = (
+    'backends.py',
+    'blocks.py',
+    'formatter.py',
+    'lkflavored.py',
+    'notebook.py',
+    'prescan.py',
+    'settings.py',
+)
+_PROJECT_MARKERS = ('.git', '.hg', 'pyproject.toml', 'setup.cfg', 'setup.py')
+_SCHEMA = '''
+    create table digests (
+        src text primary key, dst text not null, atime integer not null
+    ) without rowid;
+    create index digests_atime on digests (atime);
+    create table blocks (
+        file text primary key, data text not null, atime integer not null
+    ) without rowid;
+    create index blocks_atime on blocks (atime);
+    create table meta (key text primary key, value text) without rowid;
+'''
+# connections inherited by forked processes. they must not be used or closed -
+# there (sqlite's locks are not inherited, closing may checkpoint the wal -
+# under the parent), so they are kept alive until the process exits.
+_inherited: t.List[sqlite3.Connection] = []
+
+
+@lru_cache()
+def fingerprint(formatter: str = 'black') -> str:
+    """
+    a digest of everything that may affect the formatted output: lkfmt, black, -
+    isort, autoflake and the backend versions, the sources of our own -
+    pipeline (see `_PIPELINE_SOURCES`), plus the settings we pass to the -
+    formatters (see `backends.options`).
+    note: this function doesn't import any formatter.
+    """
+    from importlib.metadata import PackageNotFoundError
+    from importlib.metadata import version
+    
+    from . import __version__
+    
+    def get_version(pkg: str) -> str:
+        try:
+            return version(pkg)
+        except PackageNotFoundError:
+            return ''
+    
+    return _hash(
+        repr(
+            (
+                __version__,
+                get_version('lkfmt'),
+                _pipeline_digest(),
+                formatter,
+                tuple(
+                    get_version(x)
+                    for x in (
+                        'black',
+                        'isort',
+                        'autoflake',
+                        *backends.packages(formatter),
+                    )
+                ),
+                settings.AUTOFLAKE,
+                settings.ISORT,
+                backends.options(formatter),
+                settings.BLACK_HEAVY_LINE,
+            )
+        )
+    )
+
+
+def _pipeline_digest() -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for name in _PIPELINE_SOURCES:
+        with open(os.path.join(os.path.dirname(__file__), name), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def digest(code: str, file: str, formatter: str = 'black') -> str:
+    """
+    the cache key of a piece of code.
+    `__init__.py` is processed differently (see `fmt_one`), so the filename -
+    takes part in the key too.
+    """
+    return _hash(
+        '{}:{}:{}'.format(
+            fingerprint(formatter),
+            'init' if fs.filename(file) == '__init__.py' else 'module',
+            code,
+        )
+    )
+
+
+def _hash(text: str) -> str:
+    return hashlib.blake2b(
+        text.encode('utf-8', 'surrogatepass'), digest_size=16
+    ).hexdigest()
+
+
+class Cache:
+    """
+    content-hash based cache.
+    
+    it maps the digest of a source code to the digest of its formatted result. -
+    a formatted result maps to itself, so a file that is already formatted is -
+    recognized after one hash, without loading any formatter.
+    since the keys are content based, touching a file or switching git -
+    branches doesn't invalidate the record.
+    
+    large modules also keep a table of formatted blocks, see `blocks`. they -
+    are keyed by the path relative to the project, so the database can be -
+    moved to another checkout.
+    
+    reads go to the database directly (it's opened lazily, and not created -
+    by reads), writes are buffered until `save`.
+    """
+    
+    file: t.Optional[str]  # the database. None means nothing is persisted.
+    root: str  # the project dir.
+    _blocks: t.Dict[str, t.Dict[str, str]]  # dict[relpath, blocks.T.Table]
+    _cache: t.Dict[str, str]  # dict[src_digest, dst_digest], to be saved.
+    _hits: t.Set[str]  # digests found formatted, their atime is refreshed.
+    
+    def __init__(self, file: str = None, root: str = None) -> None:
+        self._conn = None
+        self._pid = None
+        self._blocks = {}
+        self._cache = {}
+        self._hits = set()
+        self.file = file
+        self.root = root or os.getcwd()
+        self._bound = file is not None
+        self._disabled = False
+    
+    @property
+    def location(self) -> t.Tuple[t.Optional[str], str]:
+        """
+        returns: (file, root), see `open`.
+        """
+        if not self._bound:
+            self.open(*locate(os.getcwd()))
+        return self.file, self.root
+    
+    def bind(self, path: str) -> None:
+        """
+        use the database of the project that `path` belongs to.
+        the buffered records of the previous database are saved first.
+        """
+        if not self._disabled:
+            self.open(*locate(path))
+    
+    def open(self, file: t.Optional[str], root: str) -> None:
+        """
+        params:
+            file: None means nothing is read from or saved to disk.
+        """
+        if self._bound and (file, root) == (self.file, self.root): return
+        self.save()
+        self.close()
+        self.file, self.root, self._bound = file, root, True
+    
+    def close(self) -> None:
+        if self._conn is not None:
+            if self._pid == os.getpid():
+                self._conn.close()
+            else:
+                _inherited.append(self._conn)
+        self._conn = None
+    
+    def get(self, key: str) -> t.Optional[str]:
+        if key in self._cache:
+            return self._cache[key]
+        if row := self._query('select dst from digests where src = ?', key):
+            return row[0]
+        return None
+    
+    def set(self, src_key: str, dst_key: str) -> None:
+        self._cache[src_key] = dst_key
+        self._cache[dst_key] = dst_key
+    
+    def is_formatted(self, key: str) -> bool:
+        if self.get(key) == key:
+            self._hits.add(key)
+            return True
+        return False
+    
+    def get_blocks(self, file: str) -> t.Dict[str, str]:
+        file = self._relpath(file)
+        if file in self._blocks:
+            return self._blocks[file]
+        if row := self._query('select data from blocks where file = ?', file):
+            return json.loads(row[0])
+        return {}
+    
+    def set_blocks(self, file: str, table: t.Dict[str, str]) -> None:
+        self._blocks[self._relpath(file)] = table
+    
+    def save(self) -> None:
+        """
+        merge the buffered records into the database. records not used for -
+        a while are evicted once a day, see `prune`.
+        """
+        if not (self._cache or self._blocks or self._hits): return
+        if self._connect(create=True) is None:
+            self._cache.clear()
+            self._blocks.clear()
+            self._hits.clear()
+            return
+        now = int(time.time())
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    'insert or replace into digests values (?, ?, ?)',
+                    ((k, v, now) for k, v in self._cache.items()),
+                )
+                self._conn.executemany(
+                    'insert or replace into blocks values (?, ?, ?)',
+                    ((k, json.dumps(v), now) for k, v in self._blocks.items()),
+                )
+                # refresh at most once a day, to save writes.
+                self._conn.executemany(
+                    'update digests set atime = ? where src = ? and atime < ?',
+                    ((now, k, now - 86400) for k in self._hits),
+                )
+                row = self._conn.execute(
+                    "select value from meta where key = 'pruned_at'"
+                ).fetchone()
+            if row is None or float(row[0]) < now - 86400:
+                self.prune()
+        except sqlite3.Error as e:
+            print(f'[yellow]failed to save the cache ({e})[/]', ':r')
+        self._cache.clear()
+        self._blocks.clear()
+        self._hits.clear()
+    
+    def prune(
+        self,
+        max_age: float = settings.CACHE_MAX_AGE,
+        max_entries: int = settings.CACHE_MAX_ENTRIES,
+    ) -> int:
+        """
+        params:
+            max_age: days. records not used for longer are removed.
+            max_entries: if there are more records (in each table), the -
+                least recently used ones are removed.
+        returns: count of removed records.
+        """
+        if self._connect() is None:
+            return 0
+        now = time.time()
+        removed = 0
+        with self._conn:
+            for table, key in (('digests', 'src'), ('blocks', 'file')):
+                removed += self._conn.execute(
+                    f'delete from {table} where atime < ?',
+                    (now - max_age * 86400,),
+                ).rowcount
+                removed += self._conn.execute(
+                    f"""
+                    delete from {table} where {key} in (
+                        select {key} from {table} order by atime desc
+                        limit -1 offset ?
+                    )
+                    """,
+                    (max_entries,),
+                ).rowcount
+            self._conn.execute(
+                "insert or replace into meta values ('pruned_at', ?)", (now,)
+            )
+        return removed
+    
+    def stats(self) -> t.Dict[str, t.Any]:
+        out = {
+            'file': self.file,
+            'size': sum(
+                os.path.getsize(x)
+                for x in (self.file, f'{self.file}-wal')
+                if self.file and os.path.exists(x)
+            ),
+            'digests': 0,
+            'blocks': 0,
+            'oldest': None,
+            'newest': None,
+        }
+        if self._connect() is None:
+            return out
+        out['digests'], out['oldest'], out['newest'] = self._conn.execute(
+            'select count(*), min(atime), max(atime) from digests'
+        ).fetchone()
+        out['blocks'] = self._conn.execute(
+            'select count(*) from blocks'
+        ).fetchone()[0]
+        return out
+    
+    def export(self, file: str) -> None:
+        """
+        save a compact copy of the database to `file` (overwritten).
+        """
+        self.save()
+        if self._connect() is None:
+            raise FileNotFoundError(f'no cache database for {self.root}')
+        if os.path.exists(file):
+            os.remove(file)
+        self._conn.execute('vacuum into ?', (fs.abspath(file),))
+    
+    def import_(self, file: str) -> int:
+        """
+        merge the records of another database (e.g. from `export`) into this -
+        one. for a record in both, the newer one wins.
+        
+        returns: count of imported records.
+        """
+        if not os.path.isfile(file):
+            raise FileNotFoundError(file)
+        self.save()
+        if self._connect(create=True) is None:
+            raise RuntimeError(f'no cache database for {self.root}')
+        self._conn.execute('attach database ? as other', (fs.abspath(file),))
+        try:
+            version = self._conn.execute(
+                'pragma other.user_version'
+            ).fetchone()[0]
+            if version != _CACHE_VERSION:
+                raise ValueError(
+                    f'incompatible cache: {file} (version {version}, expect '
+                    f'{_CACHE_VERSION})'
+                )
+            imported = 0
+            with self._conn:
+                for table, key, value in (
+                    ('digests', 'src', 'dst'),
+                    ('blocks', 'file', 'data'),
+                ):
+                    imported += self._conn.execute(f"""
+                        insert into main.{table}
+                        select * from other.{table} where true
+                        on conflict ({key}) do update set
+                            {value} = excluded.{value},
+                            atime = excluded.atime
+                        where excluded.atime > main.{table}.atime
+                        """).rowcount
+        finally:
+            self._conn.execute('detach database other')
+        return imported
+    
+    def disable(self) -> None:
+        self.open(None, self.root)
+        self._disabled = True
+    
+    def _connect(self, create: bool = False) -> t.Optional[sqlite3.Connection]:
+        """
+        returns: None if there is no database (yet, and not `create`).
+        """
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        if self._conn is not None:
+            _inherited.append(self._conn)
+        self._conn = None
+        if self.location[0] is None:
+            return None
+        if not os.path.exists(self.file):
+            if not create:
+                return None
+            _init_dir(os.path.dirname(self.file))
+        conn = sqlite3.connect(self.file, timeout=30)
+        try:
+            conn.execute('pragma journal_mode = wal')
+            with conn:
+                conn.execute('begin immediate')
+                version = conn.execute('pragma user_version').fetchone()[0]
+                if version != _CACHE_VERSION:
+                    for table in ('digests', 'blocks', 'meta'):
+                        conn.execute(f'drop table if exists {table}')
+                    # not `executescript`, which commits (and unlocks) first.
+                    for stmt in filter(str.strip, _SCHEMA.split(';')):
+                        conn.execute(stmt)
+                    conn.execute(f'pragma user_version = {_CACHE_VERSION}')
+        except sqlite3.Error as e:
+            conn.close()
+            print(f'[yellow]the cache is not available ({e})[/]', ':r')
+            self.file = None
+            return None
+        self._conn, self._pid = conn, os.getpid()
+        return conn
+    
+    def _query(self, sql: str, *args: t.Any) -> t.Optional[tuple]:
+        if self._connect() is None:
+            return None
+        try:
+            return self._conn.execute(sql, args).fetchone()
+        except sqlite3.Error:
+            return None
+    
+    def _relpath(self, file: str) -> str:
+        return os.path.relpath(os.path.abspath(file), self.root).replace(
+            os.sep, '/'
+        )
+
+
+def locate(path: str) -> t.Tuple[str, str]:
+    """
+    returns: (database_file, project_dir)
+    """
+    path = os.path.abspath(path)
+    if not os.path.isdir(path):
+        path = os.path.dirname(path)
+    root = path
+    while not any(
+        os.path.exists(os.path.join(root, x)) for x in _PROJECT_MARKERS
+    ):
+        if (parent := os.path.dirname(root)) == root:
+            root = path
+            break
+        root = parent
+    cache_dir = os.getenv('LKFMT_CACHE_DIR') or os.path.join(
+        root, '.lkfmt_cache'
+    )
+    return os.path.join(cache_dir, 'cache.db'), root
+
+
+def _init_dir(dir_: str) -> None:
+    os.makedirs(dir_, exist_ok=True)
+    ignore_file = os.path.join(dir_, '.gitignore')
+    if not os.path.exists(ignore_file):
+        with open(ignore_file, 'w') as f:
+            f.write('# created by lkfmt\n*\n')
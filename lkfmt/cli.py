@@ -0,0 +1,315 @@
+import os
+import sys
+import typing as t
+
+from argsense import cli
+
+from . import daemon as _daemon
+from . import diff
+from .formatter import fmt_all
+
+cli.add_cmd(fmt_all, name='fmt')
+
+
+@cli.cmd()
+def show_diff(
+    target: str,
+    context: int = 3,
+    max_hunks: int = None,
+    plain: bool = False,
+    recursive: bool = False,
+    exclude: str = None,
+    jobs: int = 1,
+) -> None:
+    """
+    show what formatting would change, nothing is written.
+    
+    args:
+        target: a file, or a dir to show the diffs of all python files in it.
+    kwargs:
+        context: unchanged lines shown around each changed hunk.
+        max_hunks: show at most this many hunks per file.
+        plain: print a unified diff (like `git diff`) without colors, for -
+            pipes and patch tools. nothing else is printed.
+        recursive (-r): also walk the subdirs of a dir target.
+        exclude: comma separated globs of dirs or files to skip, in -
+            addition to `settings.EXCLUDE` and `.gitignore` rules.
+        jobs (-j): number of processes to format files in parallel. diffs -
+            are still printed in file order.
+    """
+    import lk_logger
+    from lk_utils import fs
+    
+    from . import formatter as fmt
+    from .parallel import fmt_many
+    
+    root, files = fmt._find_files(
+        target, recursive, exclude.split(',') if exclude else ()
+    )
+    fmt._cache.bind(root)
+    keys = {}
+    codes = {}
+    # the origin code of the files in flight. `fmt_many` pops `codes`.
+    origins = {}
+    failures = []
+    
+    def pending() -> t.Iterator[str]:
+        # files known to be formatted have nothing to show.
+        for f in fmt._filter_formatted(
+            files, keys, codes=codes, failures=failures
+        ):
+            origins[f] = codes[f]
+            yield f
+    
+    if plain:
+        lk_logger.mute()
+    cnt = 0
+    try:
+        for f, code, changes in fmt_many(
+            pending(), jobs, failures=failures, sources=codes, inplace=False
+        ):
+            origin = origins.pop(f)
+            if code == origin:
+                continue
+            cnt += 1
+            relpath = fs.relpath(f, root)
+            if not plain:
+                print(
+                    ':r',
+                    '[cyan]{}[/] ({})'.format(
+                        relpath, fmt._markup_changes(changes)
+                    ),
+                )
+            diff.show_diff(
+                origin,
+                code,
+                context,
+                max_hunks,
+                plain,
+                relpath.replace(os.sep, '/'),
+            )
+    finally:
+        if plain:
+            lk_logger.unmute()
+    if not plain:
+        if not cnt:
+            print('[green dim]no file would be changed[/]', ':r')
+        fmt._report_failures(failures, None, root)
+    elif failures:
+        for f, reason in failures:
+            sys.stderr.write(f'lkfmt: failed: {f} ({reason})\n')
+    if failures: sys.exit(1)
+
+
+@cli.cmd()
+def watch(
+    target: str = '.',
+    exclude: str = None,
+    debounce: float = 0.2,
+    poll: bool = False,
+    interval: float = 1.0,
+) -> None:
+    """
+    watch a dir (recursively), reformat python files as soon as they are -
+    saved. formatters and the cache stay loaded between saves.
+    
+    kwargs:
+        exclude: comma separated globs of dirs or files to skip, in -
+            addition to `settings.EXCLUDE` and `.gitignore` rules.
+        debounce: seconds to wait for a burst of saves to settle.
+        poll: poll the files instead of using inotify (which is linux -
+            only, other platforms always poll).
+        interval: seconds between two scans in polling mode.
+    """
+    from .watcher import watch
+    
+    watch(
+        target,
+        exclude.split(',') if exclude else (),
+        debounce,
+        poll,
+        interval,
+    )
+
+
+@cli.cmd()
+def merge_reports(*files: str, out: str = None) -> None:
+    """
+    merge the json reports of shards (`lkfmt fmt --shard i/N --report ...`), -
+    print a summary. exit with code 1 if any file failed, or (for reports of -
+    check mode) would be reformatted.
+    
+    kwargs:
+        out: save the merged report to a json file.
+    """
+    from lk_utils import dumps
+    
+    from . import shard
+    
+    merged = shard.merge_reports(files)
+    changed, failed = shard.summarize(merged)
+    if out:
+        dumps(merged, out, 'json')
+        print(f'[dim]merged report saved to {out}[/]', ':r')
+    if failed or (merged['check'] and changed): sys.exit(1)
+
+
+@cli.cmd()
+def bench_backends(
+    target: str = '.',
+    backends: str = None,
+    recursive: bool = True,
+    exclude: str = None,
+) -> None:
+    """
+    measure the throughput of formatter backends on a tree, to choose the -
+    fastest one for a repo.
+    every backend formats the same python files, one backend after another -
+    in this process. only the backends run, on the sources as they are on -
+    disk: the other stages of the pipeline (autoflake, isort, lkflavored) -
+    are not run, so the numbers are not the time of a full `lkfmt` run.
+    
+    kwargs:
+        backends: comma separated names, default to all registered ones. a -
+            backend that is not installed is reported and skipped.
+        recursive (-r):
+        exclude: comma separated globs of dirs or files to skip, in -
+            addition to `settings.EXCLUDE` and `.gitignore` rules.
+    """
+    from . import backends as _backends
+    from . import fileio
+    from .formatter import _find_files
+    
+    _, files = _find_files(
+        target, recursive, exclude.split(',') if exclude else ()
+    )
+    codes = {f: fileio.read(f) for f in files if f.endswith('.py')}
+    if not codes:
+        print('[yellow]no python file found[/]', ':r')
+        return
+    print(
+        ':r',
+        '[cyan]{} files, {} lines[/]'.format(
+            len(codes), sum(x.count('\n') for x in codes.values())
+        ),
+    )
+    
+    results = {}
+    for name in backends.split(',') if backends else _backends.names():
+        try:
+            results[name] = r = _backends.bench(codes, name)
+        except ImportError as e:
+            print(f'[yellow]{name}: not available ({e})[/]', ':r')
+            continue
+        except ValueError as e:  # unknown backend.
+            print(f'[red]{e}[/]', ':r')
+            continue
+        print(
+            ':r',
+            '[green]{:<10}[/] {:>8.1f} files/s {:>10.0f} lines/s '
+            '[dim](setup {:.2f}s, total {:.2f}s)[/]{}'.format(
+                name,
+                r.files / r.seconds if r.seconds else 0,
+                r.lines / r.seconds if r.seconds else 0,
+                r.setup,
+                r.seconds,
+                f' [red]{r.failures} failed[/]' if r.failures else '',
+            ),
+        )
+    if len(results) > 1:
+        fastest = min(results, key=lambda x: results[x].seconds)
+        print(f'[cyan]fastest: {fastest}[/]', ':r')
+
+
+@cli.cmd()
+def cache(
+    action: str,
+    file: str = None,
+    target: str = '.',
+    max_age: float = None,
+    max_entries: int = None,
+) -> None:
+    """
+    manage the cache database of a project.
+    
+    args:
+        action: one of:
+            stats: print the location, size and record counts.
+            prune: evict old records, see `max_age` and `max_entries`.
+            export: save a compact copy of the database to `file`.
+            import: merge the records of `file` into the database.
+    kwargs:
+        file: the database file to export to or import from. e.g. ci can -
+            export the cache as an artifact, and import it in the next run.
+        target: a path in the project. the database can also be set by env -
+            var `LKFMT_CACHE_DIR`.
+        max_age: remove the records not used for this many days. default -
+            to `settings.CACHE_MAX_AGE`.
+        max_entries: remove the least recently used records beyond this -
+            many. default to `settings.CACHE_MAX_ENTRIES`.
+    """
+    import time
+    
+    from . import settings
+    from .formatter import _cache
+    
+    _cache.bind(target)
+    if action == 'stats':
+        stats = _cache.stats()
+        print(':r', f'[cyan]{stats["file"]}[/]')
+        print(':r', '    size:    {:.1f} KB'.format(stats['size'] / 1024))
+        print(':r', f'    digests: {stats["digests"]}')
+        print(':r', f'    blocks:  {stats["blocks"]}')
+        for k in ('oldest', 'newest'):
+            if stats[k] is not None:
+                print(
+                    ':r',
+                    '    {}:  {}'.format(
+                        k,
+                        time.strftime(
+                            '%Y-%m-%d %H:%M', time.localtime(stats[k])
+                        ),
+                    ),
+                )
+    elif action == 'prune':
+        removed = _cache.prune(
+            settings.CACHE_MAX_AGE if max_age is None else max_age,
+            settings.CACHE_MAX_ENTRIES if max_entries is None else max_entries,
+        )
+        print(f'[green]{removed} records removed[/]', ':r')
+    elif action in ('export', 'import'):
+        if not file:
+            raise ValueError(f'`{action}` requires a file')
+        if action == 'export':
+            _cache.export(file)
+            print(f'[green]cache exported to {file}[/]', ':r')
+        else:
+            imported = _cache.import_(file)
+            print(f'[green]{imported} records imported from {file}[/]', ':r')
+    else:
+        raise ValueError(
+            f'unknown action: {action}, expect stats, prune, export or import'
+        )
+
+
+@cli.cmd()
+def daemon(socket_file: str = None, stop: bool = False) -> None:
+    """
+    run a long-lived formatter server on a local unix socket.
+    when it's running, `lkfmt [target] [-r]` is forwarded to it, which skips -
+    the cold import of formatters.
+    
+    kwargs:
+        socket_file: default to `$XDG_RUNTIME_DIR/lkfmt-<uid>.sock` or -
+            `/tmp/lkfmt-<uid>/daemon.sock`. can also be set by env var -
+            `LKFMT_SOCKET`. the client only uses a socket owned by the -
+            current user.
+        stop: stop the running daemon.
+    """
+    if stop:
+        if _daemon.stop(socket_file):
+            print('[green]daemon stopped[/]', ':r')
+        else:
+            print('[yellow dim]no daemon running[/]', ':r')
+        return
+    _daemon.serve(socket_file)
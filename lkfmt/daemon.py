@@ -0,0 +1,281 @@
+"""
+a long-lived formatter server on a local unix socket.
+
+the server keeps the `fmt_one` pipeline warm (formatters imported, config -
+objects built, cache loaded in memory), so editor and pre-commit invocations -
+don't pay for the cold import every time.
+
+protocol: the client sends one json object and shuts down its writing side, -
+the server replies one json object and closes the connection.
+    request: {'cmd': 'fmt', 'cwd': str, 'target': str, 'recursive': bool}
+        | {'cmd': 'fmt_code', 'code': str, 'filename': str}
+        | {'cmd': 'stop'}
+    response: {'ok': True, 'root': str, 'results': [[file, i, u, d], ...]}
+        | {'ok': True, 'code': str}
+        | {'ok': False, 'error': str}
+
+security: the daemon returns code that the client writes to disk, so the -
+client only talks to a socket that is owned by the current user, and (on -
+linux) served by a process of the current user. without `$XDG_RUNTIME_DIR`, -
+the socket lives in a private (0700) dir under `/tmp`, and it's created with -
+a umask that leaves it accessible to the owner only.
+
+note: this module is imported by the `lkfmt` entry point before anything -
+else, keep it light (stdlib only at module level).
+"""
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+import typing as t
+
+
+def get_socket_file() -> str:
+    if x := os.environ.get('LKFMT_SOCKET'): return x
+    if x := os.environ.get('XDG_RUNTIME_DIR'):
+        return os.path.join(x, 'lkfmt-{}.sock'.format(os.getuid()))
+    return os.path.join(_private_dir(), 'daemon.sock')
+
+
+# -----------------------------------------------------------------------------
+# server
+
+
+def serve(socket_file: str = None) -> None:
+    from . import formatter
+    
+    if not hasattr(socket, 'AF_UNIX'):
+        raise OSError('daemon mode requires unix socket support')
+    socket_file = socket_file or get_socket_file()
+    if os.path.dirname(socket_file) == _private_dir():
+        _make_private_dir(_private_dir())
+    if os.path.lexists(socket_file):
+        if _request({'cmd': 'ping'}, socket_file) is not None:
+            print(f'[yellow]daemon is already running: {socket_file}[/]', ':r')
+            return
+        if os.lstat(socket_file).st_uid != os.getuid():
+            raise PermissionError(
+                13, 'socket file is owned by another user', socket_file
+            )
+        os.remove(socket_file)  # stale socket left by a killed daemon.
+    
+    formatter.warmup()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # the socket is created with the mode of the umask, there must be no -
+    # window in which other users can connect.
+    umask = os.umask(0o177)
+    try:
+        server.bind(socket_file)
+    finally:
+        os.umask(umask)
+    server.listen()
+    print(f'[green]lkfmt daemon is serving at {socket_file}[/]', ':r')
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                # nothing a client sends (or fails to receive) may stop the -
+                # daemon, except the stop command.
+                stop = False
+                try:
+                    req = json.loads(_recv_all(conn))
+                    if not isinstance(req, dict):
+                        raise ValueError('the request is not a json object')
+                    stop = req.get('cmd') == 'stop'
+                    resp = {'ok': True} if stop else _handle(req)
+                except Exception as e:
+                    resp = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+                try:
+                    _send(conn, resp)
+                except OSError:
+                    pass  # the client has left.
+                if stop:
+                    break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if os.path.exists(socket_file):
+            os.remove(socket_file)
+        print('[dim]lkfmt daemon stopped[/]', ':r')
+
+
+def _handle(req: dict) -> dict:
+    from . import formatter as fmt
+    
+    if req['cmd'] == 'ping':
+        return {'ok': True}
+    if req['cmd'] == 'fmt_code':
+        return {
+            'ok': True,
+            'code': fmt._fmt_code(req['code'], req['filename'], 'black'),
+        }
+    assert req['cmd'] == 'fmt', req
+    target = os.path.join(req['cwd'], req['target'])
+    root, files = fmt._find_files(target, req['recursive'])
+    fmt._cache.bind(root)
+    keys = {}
+    failures = []
+    files = tuple(fmt._filter_formatted(files, keys, failures=failures))
+    results = []
+    for f in files:
+        # a file that fails is reported, the others go on.
+        try:
+            code, (i, u, d) = fmt.fmt_one(f, quiet=True)
+        except Exception as e:
+            failures.append((f, f'{type(e).__name__}: {e}'))
+            continue
+        fmt._cache.set(keys[f], fmt.digest(code, f))
+        results.append((os.path.relpath(f, root), i, u, d))
+    fmt._cache.save()  # also when all are hits, to refresh their atime.
+    return {
+        'ok': True,
+        'root': root,
+        'results': results,
+        'failures': [(os.path.relpath(f, root), x) for f, x in failures],
+    }
+
+
+# -----------------------------------------------------------------------------
+# client
+
+
+def run_client(argv: t.List[str]) -> t.Optional[int]:
+    """
+    forward a plain formatting command to the running daemon.
+    
+    returns: exit code, or None if there is no daemon running or the argv -
+        is something the thin client doesn't understand (then the caller -
+        should fall back to the full cli).
+    """
+    target = '.'
+    recursive = False
+    for arg in argv:
+        if arg in ('-r', '--recursive'):
+            recursive = True
+        elif arg.startswith('-') or target != '.':
+            return None
+        else:
+            target = arg
+    socket_file = get_socket_file()
+    if not os.path.exists(socket_file): return None
+    resp = _request(
+        {
+            'cmd': 'fmt',
+            'cwd': os.getcwd(),
+            'target': target,
+            'recursive': recursive,
+        },
+        socket_file,
+    )
+    if resp is None: return None
+    if not resp['ok']:
+        sys.stderr.write('lkfmt daemon: {}\n'.format(resp['error']))
+        return 1
+    cnt = 0
+    for file, i, u, d in resp['results']:
+        if (i, u, d) == (0, 0, 0):
+            sys.stdout.write(f'reformat done: {file} (no code change)\n')
+        else:
+            cnt += 1
+            sys.stdout.write(
+                f'reformat done: {file} '
+                f'({i} insertions, {u} updates, {d} deletions)\n'
+            )
+    if not resp['results']:
+        sys.stdout.write('no file modified\n')
+    elif cnt == 0:
+        sys.stdout.write('all done with no file changed\n')
+    else:
+        sys.stdout.write(f'all done with {cnt} files changed\n')
+    # a daemon of an older version doesn't send failures.
+    if failures := resp.get('failures'):
+        for file, reason in failures:
+            sys.stderr.write(f'lkfmt: failed: {file} ({reason})\n')
+        return 1
+    return 0
+
+
+def request_fmt_code(code: str, filename: str) -> t.Optional[dict]:
+    """
+    returns: the daemon's response, or None if there is no daemon running.
+    """
+    socket_file = get_socket_file()
+    if not os.path.exists(socket_file): return None
+    return _request(
+        {'cmd': 'fmt_code', 'code': code, 'filename': filename}, socket_file
+    )
+
+
+def stop(socket_file: str = None) -> bool:
+    resp = _request({'cmd': 'stop'}, socket_file or get_socket_file())
+    return resp is not None
+
+
+def _request(req: dict, socket_file: str) -> t.Optional[dict]:
+    """
+    returns: the response, or None if there is no daemon we can trust.
+    """
+    try:
+        if not _is_own_socket(socket_file):
+            return None
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(socket_file)
+            if not _is_own_peer(conn):
+                return None
+            _send(conn, req)
+            return json.loads(_recv_all(conn))
+    except (OSError, ValueError):
+        return None
+
+
+def _private_dir() -> str:
+    return '/tmp/lkfmt-{}'.format(os.getuid())
+
+
+def _make_private_dir(path: str) -> None:
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid():
+        # pre-created by another user, or a symlink to somewhere else.
+        raise PermissionError(13, 'not a private dir of the user', path)
+    if st.st_mode & 0o077:
+        os.chmod(path, 0o700)
+
+
+def _is_own_socket(socket_file: str) -> bool:
+    st = os.lstat(socket_file)
+    return stat.S_ISSOCK(st.st_mode) and st.st_uid == os.getuid()
+
+
+def _is_own_peer(conn: socket.socket) -> bool:
+    """
+    check the user of the server process. only linux tells it, on other -
+    platforms we rely on `_is_own_socket`.
+    """
+    if not hasattr(socket, 'SO_PEERCRED'): return True
+    cred = conn.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')
+    )
+    _, uid, _ = struct.unpack('3i', cred)
+    return uid == os.getuid()
+
+
+# -----------------------------------------------------------------------------
+
+
+def _send(conn: socket.socket, data: dict) -> None:
+    conn.sendall(json.dumps(data).encode('utf-8'))
+    conn.shutdown(socket.SHUT_WR)
+
+
+def _recv_all(conn: socket.socket) -> str:
+    chunks = []
+    while chunk := conn.recv(65536):
+        chunks.append(chunk)
+    return b''.join(chunks).decode('utf-8')
@@ -1,5 +1,11 @@
 import re
+import sys
 import typing as t
+from bisect import bisect_left
+from bisect import bisect_right
+from collections import Counter
+from difflib import IS_CHARACTER_JUNK
+from difflib import SequenceMatcher
 from difflib import ndiff
 
 
@@ -11,6 +17,8 @@ class T:
     Diffs1 = t.Iterator[
         t.Tuple[ChangeMark, t.Union[RawLine, t.Literal['+', '-']]]
     ]
+    # (tag, a_start, a_end, b_start, b_end), see `SequenceMatcher.get_opcodes`.
+    Opcode = t.Tuple[str, int, int, int, int]
 
 
 def stat_changes(a: str, b: str, verbose=False) -> T.Changes:
@@ -39,47 +47,141 @@ def stat_changes(a: str, b: str, verbose=False) -> T.Changes:
     return insertions, updates, deletions
 
 
-def show_diff(a: str, b: str) -> None:
-    print(':dfs', 'showing diff...')
-    re_mask = re.compile(r'\^+')
+def show_diff(
+    a: str,
+    b: str,
+    context: int = 3,
+    max_hunks: int = None,
+    plain: bool = False,
+    filename: str = '',
+) -> int:
+    """
+    print the changed hunks of `a -> b`, each with `context` unchanged lines -
+    around it.
 
-    for index, (mark, line) in enumerate(
-        _squirsh_diffs(_diff(a.splitlines(), b.splitlines()))
-    ):
-        print(
-            ':rs1',
-            '[{color}]'
-            '[dim]\\[{index}]\\[{mark}] [bright_black]|[/] [/]'
-            '{line}[/]'.format(
-                color=(
-                    'green'
-                    if mark == '+'
-                    else (
-                        'red'
-                        if mark == '-'
-                        else 'yellow' if mark == '?' else 'default'
-                    )
-                ),
-                index=str(index + 1).rjust(3),
-                mark=mark,
-                line=(
-                    line.replace('[', '\\[')
-                    if mark != '?'
-                    else re_mask.sub(
-                        lambda m: '[bright_black dim]{}[/]'.format(
-                            m.group().replace('^', '.')
+    hunks are produced lazily: one hunk is diffed, rendered and printed (in -
+    a single write) before the next one, unchanged lines outside the context -
+    are never rendered.
+
+    params:
+        max_hunks: print at most this many hunks, then tell how many are left.
+        plain: write a unified diff (like `git diff`) to stdout, without rich -
+            markup. made for pipes and other tools.
+        filename: shown in the headers of the plain diff.
+    returns: the count of all hunks, including the ones not printed.
+    """
+    a_lines, b_lines = a.splitlines(), b.splitlines()
+    hunks = iter_hunks(a_lines, b_lines, context)
+    count = 0
+    for opcodes in hunks:
+        if max_hunks is not None and count >= max_hunks:
+            count += 1 + sum(1 for _ in hunks)
+            if not plain:
+                print(
+                    ':r',
+                    '[dim]... {} more hunks not shown[/]'.format(
+                        count - max_hunks
+                    ),
+                )
+            break
+        if plain:
+            if count == 0:
+                sys.stdout.write(f'--- a/{filename}\n+++ b/{filename}\n')
+            sys.stdout.write(''.join(_unified_hunk(a_lines, b_lines, opcodes)))
+        else:
+            print(
+                ':rs1',
+                '\n'.join(
+                    (
+                        '[cyan dim]{}[/]'.format(_hunk_header(opcodes)),
+                        *(
+                            _render_line(mark, line)
+                            for mark, line in _squirsh_diffs(
+                                [
+                                    # the hint lines (`? ...`) end with '\n'.
+                                    (x[0], x[2:].rstrip('\n'))
+                                    for x in _compare_opcodes(
+                                        a_lines, b_lines, opcodes
+                                    )
+                                ]
+                            )
                         ),
-                        line.replace('[', '\\['),
                     )
                 ),
+            )
+        count += 1
+    return count
+
+
+def iter_hunks(
+    a: t.Sequence[str], b: t.Sequence[str], context: int = 3
+) -> t.Iterator[t.List[T.Opcode]]:
+    """
+    yields: the opcodes of each hunk, the equal ones at both ends are -
+        trimmed to `context` lines. nothing is yielded if `a == b`.
+    """
+    return SequenceMatcher(None, a, b).get_grouped_opcodes(context)
+
+
+_re_mask = re.compile(r'\^+')
+
+
+def _render_line(mark: T.ChangeMark, line: str) -> str:
+    color = {'+': 'green', '-': 'red', '?': 'yellow'}.get(mark, 'default')
+    line = line.replace('[', '\\[')
+    if mark == '?':
+        line = _re_mask.sub(
+            lambda m: '[bright_black dim]{}[/]'.format(
+                m.group().replace('^', '.')
             ),
+            line,
         )
+    return f'[{color}][dim]\\[{mark}] [bright_black]|[/] [/]{line}[/]'
+
 
+def _hunk_header(opcodes: t.List[T.Opcode]) -> str:
+    first, last = opcodes[0], opcodes[-1]
+    return '@@ -{} +{} @@'.format(
+        _format_range(first[1], last[2]),
+        _format_range(first[3], last[4]),
+    )
 
-def _diff(a: t.Sequence[str], b: t.Sequence[str]) -> T.Diffs0:
+
+def _format_range(start: int, stop: int) -> str:
+    """
+    the range of a unified diff hunk, e.g. `'3,4'`. the same as -
+    `difflib._format_range_unified`.
+    """
+    length = stop - start
+    if length == 1:
+        return str(start + 1)
+    # an empty range begins at the line just before it.
+    return '{},{}'.format(start + 1 if length else start, length)
+
+
+def _unified_hunk(
+    a: t.Sequence[str], b: t.Sequence[str], opcodes: t.List[T.Opcode]
+) -> t.Iterator[str]:
+    yield _hunk_header(opcodes) + '\n'
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal':
+            for x in a[i1:i2]:
+                yield ' ' + x + '\n'
+            continue
+        for x in a[i1:i2]:
+            yield '-' + x + '\n'
+        for x in b[j1:j2]:
+            yield '+' + x + '\n'
+
+
+def _diff(
+    a: t.Sequence[str],
+    b: t.Sequence[str],
+    engine: t.Literal['fast', 'ndiff'] = 'fast',
+) -> T.Diffs0:
     from .formatter import _debug
     out: T.Diffs0 = []
-    for diff in ndiff(a, b):
+    for diff in (_compare(a, b) if engine == 'fast' else ndiff(a, b)):
         mask, line = diff[0], diff[2:].replace('\n', '')
         if _debug:
             print(f'[{mask}]', line, ':vsi2')
@@ -87,6 +189,247 @@ def _diff(a: t.Sequence[str], b: t.Sequence[str]) -> T.Diffs0:
     return out
 
 
+def _compare(a: t.Sequence[str], b: t.Sequence[str]) -> t.Iterator[str]:
+    """
+    a drop-in replacement of `difflib.ndiff(a, b)`, the output is identical.
+
+    `ndiff` pairs the lines of a replaced block by searching all line pairs -
+    for the most similar one, then recursing on both sides of it. every -
+    level of the recursion computes the similarity of its pairs again, which -
+    goes cubic on large blocks. we do the same search, but each ratio is -
+    computed once per block (see `_Pairing`), and the recursion is a loop, -
+    so a large block doesn't hit the recursion limit.
+    """
+    return _compare_opcodes(a, b, SequenceMatcher(None, a, b).get_opcodes())
+
+
+def _compare_opcodes(
+    a: t.Sequence[str], b: t.Sequence[str], opcodes: t.Iterable[T.Opcode]
+) -> t.Iterator[str]:
+    """
+    the `ndiff` lines of some opcodes of `a` and `b`, see `_compare`.
+    """
+    for tag, alo, ahi, blo, bhi in opcodes:
+        if tag == 'equal':
+            for x in a[alo:ahi]:
+                yield '  ' + x
+        elif tag == 'delete':
+            for x in a[alo:ahi]:
+                yield '- ' + x
+        elif tag == 'insert':
+            for x in b[blo:bhi]:
+                yield '+ ' + x
+        else:
+            yield from _Pairing(a, b, alo, ahi).replace(alo, ahi, blo, bhi)
+
+
+class _Pairing:
+    """
+    the pairing of `ndiff` in a replaced block, the same search as -
+    `difflib.Differ._fancy_replace` (which is private): find the most -
+    similar pair of lines, use it as a synch point (with intraline -
+    marking), and go on with both sides of it. if no pair is similar -
+    enough, the first identical pair is used, or else the block is dumped -
+    as is.
+
+    the result is the same pair as `_fancy_replace` picks: the first one (in -
+    the order of b, then a) with the highest ratio above the cutoff. what -
+    differs is the work to find it:
+        - the ratios are cached across the sub-blocks.
+        - the best ratio of a sub-block is at least the best one already -
+            known in it, lines that cannot reach it are skipped.
+        - `real_quick_ratio` only depends on the line lengths, so only the -
+            lines of a with close lengths are visited (see `_lengths`).
+    """
+
+    def __init__(
+        self, a: t.Sequence[str], b: t.Sequence[str], alo: int, ahi: int
+    ) -> None:
+        self.a = a
+        self.b = b
+        self.cruncher = SequenceMatcher(IS_CHARACTER_JUNK)
+        # dict[(i, j), ratio], `quick_ratio` and `ratio` of the pairs.
+        self._quick: t.Dict[t.Tuple[int, int], float] = {}
+        self._ratio: t.Dict[t.Tuple[int, int], float] = {}
+        # one cruncher per line of b, `set_seq2` caches the most of the work.
+        self._crunchers: t.Dict[int, SequenceMatcher] = {}
+        # the char counts of the lines, for `quick_ratio`.
+        self._counts_a: t.Dict[int, t.Counter[str]] = {}
+        self._counts_b: t.Dict[int, t.Counter[str]] = {}
+        # the indexes of `a[alo:ahi]` sorted by line length, and the lengths.
+        self._order = sorted(range(alo, ahi), key=lambda i: len(a[i]))
+        self._lengths = [len(a[i]) for i in self._order]
+
+    def replace(
+        self, alo: int, ahi: int, blo: int, bhi: int
+    ) -> t.Iterator[str]:
+        a, b = self.a, self.b
+        # a stack of sub-blocks `(alo, ahi, blo, bhi, known_ratios)` and -
+        # lines to output, popped in the output order. the recursion of -
+        # `_fancy_replace` goes too deep on large blocks.
+        stack: t.List[t.Union[tuple, t.List[str]]] = [(alo, ahi, blo, bhi, {})]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, list):
+                yield from item
+                continue
+            alo, ahi, blo, bhi, known = item
+            if alo >= ahi or blo >= bhi:
+                yield from ('- ' + x for x in a[alo:ahi])
+                yield from ('+ ' + x for x in b[blo:bhi])
+                continue
+            if (pair := self._find_synch(alo, ahi, blo, bhi, known)) is None:
+                # the shorter block first, the same as `ndiff`.
+                if bhi - blo < ahi - alo:
+                    yield from ('+ ' + x for x in b[blo:bhi])
+                    yield from ('- ' + x for x in a[alo:ahi])
+                else:
+                    yield from ('- ' + x for x in a[alo:ahi])
+                    yield from ('+ ' + x for x in b[blo:bhi])
+                continue
+            i, j = pair
+            stack.append(
+                (
+                    i + 1, ahi, j + 1, bhi,
+                    {k: r for k, r in known.items() if k[0] > i and k[1] > j},
+                )
+            )  # fmt:skip
+            # `_intraline` takes an identical pair as an equal line.
+            stack.append(list(_intraline(self.cruncher, a[i], b[j])))
+            stack.append(
+                (
+                    alo, i, blo, j,
+                    {k: r for k, r in known.items() if k[0] < i and k[1] < j},
+                )
+            )  # fmt:skip
+
+    def _find_synch(
+        self,
+        alo: int,
+        ahi: int,
+        blo: int,
+        bhi: int,
+        known: t.Dict[t.Tuple[int, int], float],
+    ) -> t.Optional[t.Tuple[int, int]]:
+        """
+        params:
+            known: dict[(i, j), ratio], the pairs of the block whose ratios -
+                are above the threshold. it's updated with the pairs -
+                computed here.
+        returns: (i, j) of the synch pair, or None if there is not any.
+        """
+        a, b = self.a, self.b
+        quick, ratio = self._quick, self._ratio
+        order, lengths = self._order, self._lengths
+        # a pair is a candidate if its ratio is above `threshold`, and it's -
+        # a synch point if the ratio is at least `cutoff`.
+        threshold, cutoff = 0.74, 0.75
+        best_ratio = max(known.values(), default=threshold)
+        best = None
+        eq = None  # the first identical pair, if any.
+        for j in range(blo, bhi):
+            bj = b[j]
+            lb = len(bj)
+            # the lines of a whose `real_quick_ratio` with `bj` may reach -
+            # `best_ratio`, with a margin for float errors. they are exactly -
+            # checked below.
+            lo = bisect_left(lengths, lb * best_ratio / (2 - best_ratio) - 1)
+            hi = bisect_right(lengths, lb * (2 - best_ratio) / best_ratio + 1)
+            if hi - lo < ahi - alo:
+                rows = [i for i in order[lo:hi] if alo <= i < ahi]
+            else:
+                rows = range(alo, ahi)
+            for i in rows:
+                ai = a[i]
+                if ai == bj:
+                    if eq is None or (eq[1] == j and i < eq[0]):
+                        eq = (i, j)
+                    continue
+                # `real_quick_ratio`, inlined.
+                la = len(ai)
+                q = 2.0 * (la if la < lb else lb) / (la + lb)
+                if q < best_ratio or q <= threshold:
+                    continue
+                key = (i, j)
+                if (q := quick.get(key)) is None:
+                    q = quick[key] = self._quick_ratio(i, j)
+                if q < best_ratio or q <= threshold:
+                    continue
+                if (r := ratio.get(key)) is None:
+                    r = ratio[key] = self._cruncher(i, j).ratio()
+                if r <= threshold:
+                    continue
+                known[key] = r
+                # ties go to the first pair in the order of `_fancy_replace`.
+                if r > best_ratio or r == best_ratio and (
+                    best is None or (best[1] == j and i < best[0])
+                ):
+                    best_ratio, best = r, key
+        if best is None or best_ratio < cutoff:
+            return eq
+        return best
+
+    def _quick_ratio(self, i: int, j: int) -> float:
+        """
+        the same as `SequenceMatcher.quick_ratio`, with the char counts of -
+        each line computed once.
+        """
+        if (ca := self._counts_a.get(i)) is None:
+            ca = self._counts_a[i] = Counter(self.a[i])
+        if (cb := self._counts_b.get(j)) is None:
+            cb = self._counts_b[j] = Counter(self.b[j])
+        matches = sum(min(n, cb[c]) for c, n in ca.items() if c in cb)
+        return 2.0 * matches / (len(self.a[i]) + len(self.b[j]))
+
+    def _cruncher(self, i: int, j: int) -> SequenceMatcher:
+        if (cruncher := self._crunchers.get(j)) is None:
+            cruncher = self._crunchers[j] = SequenceMatcher(IS_CHARACTER_JUNK)
+            cruncher.set_seq2(self.b[j])
+        if cruncher.a is not self.a[i]:
+            cruncher.set_seq1(self.a[i])
+        return cruncher
+
+
+def _intraline(
+    cruncher: SequenceMatcher, x: str, y: str
+) -> t.Iterator[str]:
+    """
+    the intraline marking of `ndiff` on a synch pair: `- x`, `? tags`, -
+    `+ y`, `? tags`. the `?` lines are omitted if their tags are blank.
+    """
+    if x == y:
+        yield '  ' + x
+        return
+    cruncher.set_seqs(x, y)
+    atags = []
+    btags = []
+    for tag, ai1, ai2, bj1, bj2 in cruncher.get_opcodes():
+        la, lb = ai2 - ai1, bj2 - bj1
+        if tag == 'replace':
+            atags.append('^' * la)
+            btags.append('^' * lb)
+        elif tag == 'delete':
+            atags.append('-' * la)
+        elif tag == 'insert':
+            btags.append('+' * lb)
+        else:
+            atags.append(' ' * la)
+            btags.append(' ' * lb)
+    yield '- ' + x
+    if tags := _keep_original_ws(x, ''.join(atags)).rstrip():
+        yield f'? {tags}\n'
+    yield '+ ' + y
+    if tags := _keep_original_ws(y, ''.join(btags)).rstrip():
+        yield f'? {tags}\n'
+
+
+def _keep_original_ws(line: str, tags: str) -> str:
+    # tabs in the line are kept in the tags, so the marks stay aligned.
+    return ''.join(
+        c if tag == ' ' and c.isspace() else tag for c, tag in zip(line, tags)
+    )
+
+
 # _re_only_ins = re.compile(r'\s*\++\s*')
 # _re_only_del = re.compile(r'\s*-\s*')
 
@@ -165,20 +508,16 @@ def _squirsh_diffs(diffs: T.Diffs0) -> T.Diffs1:
 
     def _mask(text: str, mask: str) -> str:
         assert len(text) >= len(mask)
-        out = ''
-        for x, y in zip(text, mask.ljust(len(text))):
-            if y == ' ':
-                out += x
-        return out
+        return ''.join(
+            x for x, y in zip(text, mask.ljust(len(text))) if y == ' '
+        )
 
     def _transform_3(text: str, mask: str) -> str:
         assert len(text) >= len(mask)
-        out = ''
-        for x, y in zip(text, mask.ljust(len(text))):
-            if y == ' ' or y == '+':
-                out += x
-            elif y == '^':
-                out += '^'
-        return out
+        return ''.join(
+            x if y == ' ' or y == '+' else '^'
+            for x, y in zip(text, mask.ljust(len(text)))
+            if y in ' +^'
+        )
 
     yield from main()
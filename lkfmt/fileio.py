@@ -0,0 +1,167 @@
+"""
+the i/o stages around the formatting pipeline of `fmt_all`.
+    
+    walker -> prefetch (thread) -> formatting (main process or workers) -
+        -> writer (thread)
+
+reading and writing happen in background threads with bounded queues, so -
+the disk (or network mount) latency overlaps the cpu work on other files, and -
+the memory stays bounded no matter how many files there are.
+
+files are written atomically: the new content goes to a temp file beside the -
+target, then is renamed into place. a crash or a full disk leaves either the -
+old or the new file, never a truncated one.
+"""
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import typing as t
+
+from . import profiler
+
+# how many files the reader may get ahead of the consumer, or the writer may -
+# fall behind the producer.
+DEPTH = 32
+
+
+def read(file: str) -> str:
+    with open(file, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def write(file: str, code: str) -> None:
+    """
+    write `code` to `file` atomically. the file mode is kept, a symlink is -
+    followed (the file it points to is replaced).
+    if a temp file cannot be created beside the target (e.g. the dir is not -
+    writable but the file is), it falls back to writing in place.
+    """
+    file = os.path.realpath(file)
+    if os.path.exists(file) and not os.access(file, os.W_OK):
+        # a rename would bypass the permission of the file.
+        raise PermissionError(13, 'Permission denied', file)
+    dir_, name = os.path.split(file)
+    try:
+        fd, tmp = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=dir_)
+    except OSError:
+        with open(file, 'w', encoding='utf-8') as f:
+            f.write(code)
+        return
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(code)
+        if os.path.exists(file):
+            shutil.copymode(file, tmp)
+        os.replace(tmp, file)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def prefetch(
+    files: t.Iterable[str],
+    depth: int = DEPTH,
+    failures: t.List[t.Tuple[str, str]] = None,
+) -> t.Iterator[t.Tuple[str, str]]:
+    """
+    read files in a background thread, at most `depth` files ahead.
+    `files` is also consumed in the thread, so walking the dirs overlaps the -
+    consumer's work too.
+    
+    params:
+        failures: a list to be filled with the files failed to read -
+            (`list[tuple[file, reason]]`), they are skipped. if not given, a -
+            read error is raised when its file is reached.
+    yields: (file, code)
+        in the order of `files`.
+    """
+    q = queue.Queue(depth)
+    stop = threading.Event()
+    
+    def put(item: tuple) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def run() -> None:
+        try:
+            for f in files:
+                try:
+                    with profiler.timer(f, 'read'):
+                        item = (f, read(f), None)
+                except Exception as e:
+                    item = (f, None, e)
+                if not put(item):
+                    return
+        except Exception as e:  # raised by `files`, e.g. the walker.
+            put((None, None, e))
+            return
+        put((None, None, None))
+    
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            f, code, error = q.get()
+            if error is not None:
+                if f is None or failures is None:
+                    raise error
+                failures.append((f, f'{type(error).__name__}: {error}'))
+                continue
+            if f is None:
+                break
+            yield f, code
+    finally:
+        stop.set()
+        thread.join()
+
+
+class Writer:
+    """
+    write files in a background thread, see `write`.
+    
+    usage:
+        writer = Writer()
+        try:
+            for f, code in ...:
+                writer.submit(f, code)
+        finally:
+            failures = writer.close()
+    """
+    
+    def __init__(self, depth: int = DEPTH) -> None:
+        self._failures: t.List[t.Tuple[str, str]] = []
+        self._queue = queue.Queue(depth)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def submit(self, file: str, code: str) -> None:
+        self._queue.put((file, code))
+    
+    def close(self) -> t.List[t.Tuple[str, str]]:
+        """
+        wait for all submitted files to be written.
+        
+        returns: list[tuple[file, reason]] of the files failed to write.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        return self._failures
+    
+    def _run(self) -> None:
+        while (item := self._queue.get()) is not None:
+            file, code = item
+            try:
+                with profiler.timer(file, 'write'):
+                    write(file, code)
+            except Exception as e:
+                self._failures.append((file, f'{type(e).__name__}: {e}'))
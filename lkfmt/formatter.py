@@ -1,48 +1,46 @@
+import json
 import os
+import re
+import sys
 import typing as t
+from contextlib import contextmanager
+from functools import lru_cache
 
-import autoflake
-import isort
 import lk_logger
 from lk_utils import dumps
 from lk_utils import fs
-from lk_utils import loads
-from lk_utils import xpath
 
+from . import backends
+from . import blocks
+from . import fileio
 from . import lkflavored as lkf
+from . import notebook
+from . import prescan
+from . import profiler
+from . import ranges
+from . import settings
+from . import shard as sharding
+from . import vcs
+from . import walker
+from .cache import Cache
+from .cache import digest
+from .cache import fingerprint
 from .diff import T
 from .diff import stat_changes
+from .parallel import Budget
+from .parallel import check_many
+from .parallel import fmt_many
 
 lk_logger.setup(quiet=True, show_funcname=False, show_varnames=False)
 
 
-class Cache:
-    _cache: dict  # dict[path, mtime]
-    _file: str
-    
-    def __init__(self):
-        self._file = xpath('.cache.pkl')
-        if os.path.exists(self._file):
-            self._cache = loads(self._file)
-        else:
-            self._cache = {}
-    
-    def get(self, path: str) -> t.Union[float, 0]:
-        return self._cache.get(path, 0)
-    
-    def set(self, path: str, mtime: float) -> None:
-        self._cache[path] = mtime
-    
-    def save(self) -> None:
-        dumps(self._cache, self._file)
-    
-    def disable(self) -> None:
-        self._cache.clear()
-        setattr(self, 'save', lambda: None)
-
-
 _cache = Cache()
 _debug = False
+_ndjson = False
+
+# see `check_one`.
+_irreversible_stages = ('autoflake', 'isort')
+_re_layout = re.compile(r'[\s(),\\]+')
 
 
 def fmt_all(
@@ -51,6 +49,23 @@ def fmt_all(
     inplace: bool = True,
     chdir: bool = False,
     no_cache: bool = False,
+    jobs: int = 1,
+    check: bool = False,
+    since: str = None,
+    staged: bool = False,
+    exclude: str = None,
+    profile: bool = False,
+    profile_dump: str = None,
+    lines: str = None,
+    diff_only: bool = False,
+    timeout: float = None,
+    max_memory: int = None,
+    failure_dump: str = None,
+    shard: str = None,
+    shard_by: str = 'path',
+    report: str = None,
+    format: str = 'rich',
+    notebooks: bool = False,
     **backdoor,
 ) -> None:
     """
@@ -60,9 +75,60 @@ def fmt_all(
         recursive (-r):
         inplace (-i):
         chdir (-c):
+        jobs (-j): number of processes to format files in parallel.
+            1 means formatting in the main process. 0 means using all cpu -
+            cores.
+        check: don't write anything, only list the files that would be -
+            reformatted. exit with code 1 if there is any.
+        since: a git ref. only format python files that differ from it -
+            (plus untracked files). `target` is used as pathspec, subdirs are -
+            always included.
+        staged: only format python files in the git index. the staged -
+            content (rather than the working tree) is formatted and written -
+            back to the index, the working tree is updated too if it has no -
+            unstaged changes. made for pre-commit hooks.
+        exclude: comma separated globs of dirs or files to skip, in -
+            addition to `settings.EXCLUDE` and `.gitignore` rules.
+        profile: time every stage of every file, print the total time per -
+            stage and the slowest files at the end.
+        profile_dump: save the profile to a json file. implies `profile`.
+        lines: only reformat the top-level statements overlapping these -
+            line ranges (e.g. '10-20,35'), the rest of the file stays -
+            byte-identical. target must be a file.
+            note: autoflake and isort are not run in range mode.
+        diff_only: like `lines`, but the ranges are the changed lines from -
+            `git diff <since or HEAD>`. untracked files are formatted as a -
+            whole.
+        timeout: seconds allowed for each file. a file that takes longer is -
+            killed with its worker process, and reported as failure.
+        max_memory: megabytes of address space allowed for each worker -
+            process. a file that needs more is reported as failure.
+            note: setting `timeout` or `max_memory` runs files in worker -
+            processes even if `jobs` is 1. a file that raises an error is -
+            always reported as failure and skipped, the run goes on and -
+            exits with code 1 at the end.
+        failure_dump: save the failures to a json file.
+        shard: 'i/N' (1-based), only format the i-th of N stable subsets of -
+            the files. for splitting a big job across machines.
+        shard_by: 'path' or 'size'. 'path' assigns files by the hash of -
+            their relative paths. 'size' balances the total size of shards, -
+            but has to walk all files before formatting any.
+        report: save the result of every file (changes, or whether it would -
+            be reformatted in check mode) and the failures to a json file. -
+            see `lkfmt merge-reports` for merging the reports of shards.
+        format: 'rich' or 'ndjson'. 'ndjson' prints nothing but one json -
+            object per line: a "file" record for every file (changed or -
+            not, with the per-stage durations), a "failure" record for -
+            every failed file, and a "summary" record at the end. made for -
+            editors and ci tools to parse.
+        notebooks: also format the code cells of jupyter notebooks -
+            (`.ipynb`) found in the target dir or selected by git. a -
+            notebook given as the target is formatted without it.
     backdoor: for third-party tool to quick access.
         debug: bool[False]. print more info in process.
         direct_to_fmt_file: bool[False]. directly call `fmt_file`.
+        formatter: str['black']. the backend of the main format stage, see -
+            `backends` and `lkfmt bench-backends`.
         show_diff: bool[False]. show diff after reformat. (not implemented)
             [red]careful using this option, it may dump too much info -
             overwhelming your terminal.[/]
@@ -75,80 +141,184 @@ def fmt_all(
         fmt_one(target, inplace, chdir)
         return
     
-    root: str
-    files: t.List[str]
-    
-    if target == '.':
-        root = fs.abspath(os.getcwd())
-    elif os.path.isdir(target):
-        root = fs.abspath(target)
-    elif os.path.isfile(target):
-        _cache.set(target, os.path.getmtime(target))
-        fmt_one(target, inplace, chdir)
-        return
-    else:
-        raise ValueError(f'invalid target: {target}')
-    
-    if no_cache:
-        _cache.disable()
-    if recursive:
-        files = fs.findall_file_paths(root, '.py')
-    else:
-        files = fs.find_file_paths(root, '.py')
-    if not files:
-        print('[yellow dim]no python file found[/]', ':rt')
-        return
-    # filter
-    temp = []
-    for f in files:
-        if (m := os.path.getmtime(f)) > _cache.get(f):
-            temp.append(f)
-            _cache.set(f, m)
-    if temp:
-        files = temp
-        if _debug:
-            print(files, ':vl')
-    else:
-        print('[green dim]no file modified[/]', ':rt')
-        return
-    
-    def estimate_best_column_width(files: t.List[str]) -> int:
-        maxlen = max(map(len, map(fs.filename, files)))
-        return min((maxlen, 80, lk_logger.console.console.width))
-    
-    file_col_width = estimate_best_column_width(files)
-    cnt = 0
-    for f in files:
-        _, (i, u, d) = fmt_one(f, inplace, chdir, quiet=True, **backdoor)
-        if (i, u, d) != (0, 0, 0):
-            cnt += 1
-        print(
-            ':ir',
-            '[green]reformat done: {} ({})[/]'.format(
-                fs.relpath(f, root).ljust(file_col_width),
-                (
-                    '[green dim]no code change[/]'
-                    if (i, u, d) == (0, 0, 0)
-                    else (
-                        '[cyan {dim_i}]{i} insertions,[/] '
-                        '[yellow {dim_u}]{u} updates,[/] '
-                        '[red {dim_d}]{d} deletions[/]'.format(
-                            dim_i='dim' if not i else '',
-                            dim_u='dim' if not u else '',
-                            dim_d='dim' if not d else '',
-                            i=str(i).rjust(2),
-                            u=str(u).rjust(2),
-                            d=str(d).rjust(2),
-                        )
-                    )
-                ),
-            ),
+    with _output(format):
+        formatter = backdoor.get('formatter', 'black')
+        if no_cache:
+            _cache.disable()
+        else:
+            _cache.bind(target)
+        if profile or profile_dump or _ndjson:
+            profiler.enable()
+        
+        if lines or diff_only:
+            if staged or shard:
+                raise ValueError(
+                    'range formatting does not work with `staged` or `shard`'
+                )
+            root, cnt = _fmt_ranges_all(
+                target, lines, diff_only, since, inplace, check, formatter
+            )
+            _report_profile(profile_dump, root)
+            if check and cnt:
+                sys.exit(1)
+            return
+        
+        budget = Budget(timeout, max_memory)
+        use_git = bool(since or staged)
+        if (
+            os.path.isfile(target) and
+            not check and
+            not use_git and
+            budget == Budget() and
+            not shard and
+            not report and
+            not _ndjson
+        ):  # fmt:skip
+            key = digest(fileio.read(target), target, formatter)
+            if _cache.is_formatted(key):
+                _cache.save()  # refresh the atime of the hit.
+                print('[green dim]no code change[/]', ':rt')
+                return
+            code, _ = fmt_one(target, inplace, chdir, **backdoor)
+            _cache.set(key, digest(code, target, formatter))
+            _cache.save()
+            _report_profile(profile_dump)
+            return
+        
+        suffixes = settings.SUFFIXES
+        if notebooks:
+            suffixes += settings.NOTEBOOK_SUFFIXES
+        if use_git:
+            root, files = vcs.find_changed_files(
+                target, since, staged, suffixes
+            )
+        else:
+            root, files = _find_files(
+                target,
+                recursive,
+                exclude.split(',') if exclude else (),
+                suffixes,
+            )
+        if shard:
+            shard = sharding.parse_shard(shard)
+            files = sharding.select(files, root, shard, shard_by)
+        sources = vcs.read_staged(root, files) if staged else None
+        failures = []
+        # dict[file, changes or changed], for the report.
+        entries: sharding.T.Entries = {}
+        
+        if check:
+            cnt = _check_all(
+                root, files, sources, jobs, formatter, budget, failures, entries
+            )
+            _report_profile(profile_dump, root)
+            _report_failures(failures, failure_dump, root)
+            if report:
+                sharding.dump_report(
+                    report, root, shard, True, entries, failures
+                )
+            if _ndjson:
+                _emit_summary(root, True, len(entries), cnt, failures)
+            if cnt or failures:
+                sys.exit(1)
+            return
+        
+        # files are streamed from the walker to the formatter, `keys` is filled -
+        # along the way.
+        keys = {}
+        codes = {}
+        files = _filter_formatted(
+            files, keys, formatter, sources, codes, failures
         )
-    if cnt == 0:
-        print(':rt', '[green dim]all done with no file changed[/]')
-    else:
-        print(':rt', f'[green]all done with [u]{cnt}[/] files changed[/]')
-    _cache.save()
+        
+        # we don't know the longest path in advance, the column grows with it.
+        max_col_width = min(80, lk_logger.console.console.width)
+        file_col_width = 0
+        cnt = total = 0
+        writer = None
+        # ndjson records of the files given to the writer, emitted once the -
+        # writes are done, so a file failed to write is only reported as a -
+        # failure (and its record has the 'write' stage).
+        unwritten: t.List[t.Tuple[str, T.Changes]] = []
+        if staged:
+            results = _fmt_staged(
+                root, files, sources, inplace, formatter, failures
+            )
+        else:
+            # workers only format, the files are written by a thread of the -
+            # main process. see `fileio`.
+            if inplace:
+                writer = fileio.Writer()
+            results = fmt_many(
+                files,
+                jobs,
+                budget,
+                failures,
+                codes,
+                inplace=False,
+                chdir=chdir,
+                **backdoor,
+            )
+        try:
+            for f, code, (i, u, d) in results:
+                if _debug:
+                    print(f, ':v')
+                _cache.set(keys[f], digest(code, f, formatter))
+                entries[f] = [i, u, d]
+                total += 1
+                if (i, u, d) != (0, 0, 0):
+                    cnt += 1
+                    if writer:
+                        writer.submit(f, code)
+                        if _ndjson:
+                            unwritten.append((f, (i, u, d)))
+                            continue
+                if _ndjson:
+                    _emit_file(f, root, (i, u, d))
+                    continue
+                relpath = fs.relpath(f, root)
+                file_col_width = min(
+                    max(file_col_width, len(relpath)), max_col_width
+                )
+                print(
+                    ':ir',
+                    '[green]reformat done: {} ({})[/]'.format(
+                        relpath.ljust(file_col_width),
+                        _markup_changes((i, u, d)),
+                    ),
+                )
+        finally:
+            if writer:
+                for f, reason in writer.close():
+                    failures.append((f, reason))
+                    del entries[f]
+                    cnt -= 1
+        for f, changes in unwritten:
+            if f in entries:
+                _emit_file(f, root, changes)
+        if not keys:
+            print('[yellow dim]no python file found[/]', ':rt')
+        elif total == 0:
+            print('[green dim]no file modified[/]', ':rt')
+        elif cnt == 0:
+            print(':rt', '[green dim]all done with no file changed[/]')
+        else:
+            print(':rt', f'[green]all done with [u]{cnt}[/] files changed[/]')
+        _cache.save()  # also when all are hits, to refresh their atime.
+        _report_profile(profile_dump, root)
+        _report_failures(failures, failure_dump, root)
+        failed = {f for f, _ in failures}
+        for f in keys:
+            if f not in entries and f not in failed:
+                entries[f] = [0, 0, 0]  # skipped by the cache.
+                if _ndjson:
+                    _emit_file(f, root, (0, 0, 0), cached=True)
+        if report:
+            sharding.dump_report(report, root, shard, False, entries, failures)
+        if _ndjson:
+            _emit_summary(root, False, len(entries), cnt, failures)
+        if failures:
+            sys.exit(1)
 
 
 def fmt_one(
@@ -156,137 +326,594 @@ def fmt_one(
     inplace: bool = True,
     chdir: bool = False,
     quiet: bool = False,
-    formatter: t.Literal['autopep8', 'black', 'yapf'] = 'black',
+    formatter: str = 'black',
+    code: str = None,
 ) -> t.Tuple[str, T.Changes]:
+    """
+    params:
+        code: the content of the file, if it's read already.
+    """
+    # in ndjson mode the logger is muted for the whole run, don't unmute it.
+    quiet = quiet and not _ndjson
     if quiet:
         lk_logger.mute()
+    try:
+        return _fmt_one(file, inplace, chdir, formatter, code)
+    finally:
+        if quiet:
+            lk_logger.unmute()
+
+
+def fmt_code(
+    code: str,
+    filename_hint: str = '<stdin>.py',
+    formatter: str = 'black',
+) -> t.Tuple[str, T.Changes]:
+    """
+    format a piece of code in memory, nothing is read from or written to disk.
+    
+    params:
+        filename_hint: the pipeline depends on the filename a little, e.g. -
+            unused imports are kept in `__init__.py`.
+    returns: (code, changes)
+    """
+    new_code = _fmt_code(code, filename_hint, formatter)
+    if new_code == code:
+        return new_code, (0, 0, 0)
+    with profiler.timer(filename_hint, 'stat_changes'):
+        return new_code, stat_changes(code, new_code, verbose=False)
+
+
+def check_one(
+    file: str,
+    formatter: str = 'black',
+    code: str = None,
+) -> bool:
+    """
+    check if a file would be reformatted, without writing anything.
+    
+    the pipeline stops as soon as the answer is known: autoflake and isort -
+    only remove or reorder code, no later stage can restore what they -
+    changed. so if the code differs from the origin after one of them (not -
+    counting whitespace, brackets and commas, which black may rearrange), the -
+    file will differ anyway.
+    
+    params:
+        code: check this instead of the file content (e.g. the staged -
+            content).
+    returns: True if the file would be changed.
+    """
+    code = origin_code = fileio.read(file) if code is None else code
+    if file.endswith('.ipynb'):
+        # the cells are formatted in one batch, there's no stage to stop at.
+        return _fmt_code(origin_code, file, formatter) != origin_code
+    origin_sign = None
+    for stage, code in profiler.timed(
+        file, _pipeline(origin_code, file, formatter)
+    ):
+        if stage in _irreversible_stages and code != origin_code:
+            if origin_sign is None:
+                origin_sign = _re_layout.sub('', origin_code)
+            if _re_layout.sub('', code) != origin_sign:
+                return True
+    return code != origin_code
+
+
+def _fmt_one(
+    file: str,
+    inplace: bool,
+    chdir: bool,
+    formatter: str,
+    origin_code: t.Optional[str] = None,
+) -> t.Tuple[str, T.Changes]:
     print(':v2s', file)
-    assert file.endswith(('.py', '.txt'))
+    assert file.endswith(('.py', '.ipynb', '.txt'))
     if chdir:
         os.chdir(os.path.dirname(os.path.abspath(file)))
     
-    with open(file, 'r', encoding='utf-8') as f:
-        code = origin_code = f.read()
+    if origin_code is None:
+        with profiler.timer(file, 'read'):
+            origin_code = fileio.read(file)
+    code = _fmt_code(origin_code, file, formatter)
     
-    # remove unused imports
-    if not fs.filename(file) == '__init__.py':
-        # we don't strip any import in `__init__.py`.
-        code = autoflake.fix_code(
-            code,
-            remove_all_unused_imports=True,
-            ignore_pass_statements=False,
-            ignore_pass_after_docstring=False,
-        )
+    if code == origin_code:
+        print('[green dim]no code change[/]', ':rt')
+        return code, (0, 0, 0)
     
-    # sort imports
-    code = isort.code(
-        code,
-        config=isort.Config(
-            case_sensitive=True,
-            force_single_line=True,
-            line_length=80,
-            only_modified=True,
-            profile='black',
-            reverse_relative=True,
-        ),
-    )
+    if inplace:
+        with profiler.timer(file, 'write'):
+            fileio.write(file, code)
     
-    # main format code
-    if formatter == 'autopep8':
-        import autopep8
-        
-        code = autopep8.fix_code(
-            code,
-            encoding='utf-8',
-            options={
-                'experimental': True,
-                'max_line_length': 80,
-            },
+    with profiler.timer(file, 'stat_changes'):
+        changes = stat_changes(origin_code, code, verbose=False)
+    print(
+        '[green]reformat code done: {}[/]'.format(_markup_changes(changes)),
+        ':rt',
+    )
+    return code, changes
+
+
+def _fmt_code(
+    code: str, file: str, formatter: str, imports: bool = True
+) -> str:
+    if file.endswith('.ipynb'):
+        return notebook.fmt_notebook(
+            code, lambda x: _fmt_module(x, file, formatter, imports)
         )
-    elif formatter == 'black':
-        import black
-        
-        code = black.format_str(
-            code,
-            mode=black.Mode(
-                line_length=80,
-                string_normalization=False,
-                magic_trailing_comma=True,
-                preview=True,
+    return _fmt_module(code, file, formatter, imports)
+
+
+def _fmt_module(code: str, file: str, formatter: str, imports: bool) -> str:
+    for _, code in profiler.timed(
+        file, _pipeline(code, file, formatter, imports)
+    ):
+        pass
+    return code
+
+
+def _fmt_ranges_all(
+    target: str,
+    lines: t.Optional[str],
+    diff_only: bool,
+    since: t.Optional[str],
+    inplace: bool,
+    check: bool,
+    formatter: str,
+) -> t.Tuple[str, int]:
+    """
+    returns: (root, count of changed files)
+    """
+    if diff_only:
+        root, file_ranges = vcs.changed_lines(target, since or 'HEAD')
+    else:
+        if not os.path.isfile(target):
+            raise ValueError('`lines` only works with a file target')
+        if target.endswith('.ipynb'):
+            raise ValueError('`lines` does not work with notebooks')
+        root = fs.abspath(os.path.dirname(fs.abspath(target)))
+        file_ranges = {target: ranges.parse_ranges(lines)}
+    
+    cnt = 0
+    for f, rngs in file_ranges.items():
+        with profiler.timer(f, 'read'):
+            origin_code = fileio.read(f)
+        if rngs is None:
+            code = _fmt_code(origin_code, f, formatter)
+        else:
+            code = ranges.fmt_ranges(
+                origin_code,
+                rngs,
+                lambda x: _fmt_code(x, f, formatter, imports=False),
+            )
+        relpath = fs.relpath(f, root)
+        if code == origin_code:
+            if _ndjson:
+                _emit_file(f, root, False if check else (0, 0, 0))
+            elif not check:
+                print(
+                    '[green]reformat done: {} ([dim]no code change[/])[/]'
+                    .format(relpath),
+                    ':r',
+                )
+            continue
+        cnt += 1
+        if check:
+            if _ndjson:
+                _emit_file(f, root, True)
+            print(f'[yellow]would reformat: {relpath}[/]', ':r')
+            continue
+        if inplace:
+            with profiler.timer(f, 'write'):
+                fileio.write(f, code)
+        with profiler.timer(f, 'stat_changes'):
+            changes = stat_changes(origin_code, code, verbose=False)
+        if _ndjson:
+            _emit_file(f, root, changes)
+        print(
+            '[green]reformat done: {} ({})[/]'.format(
+                relpath, _markup_changes(changes)
             ),
+            ':r',
         )
-    elif formatter == 'yapf':
-        import yapf
-        
-        code, _ = yapf.yapf_api.FormatCode(
-            code,
-            filename=fs.filename(file),
-            # ref: yapf.yapflib.style._STYLE_HELP
-            style_config={
-                'ALIGN_CLOSING_BRACKET_WITH_VISUAL_INDENT': True,
-                'ALLOW_MULTILINE_DICTIONARY_KEYS': True,
-                'ALLOW_MULTILINE_LAMBDAS': True,
-                'ALLOW_SPLIT_BEFORE_DEFAULT_OR_NAMED_ASSIGNS': True,
-                'ALLOW_SPLIT_BEFORE_DICT_VALUE': True,
-                'ARITHMETIC_PRECEDENCE_INDICATION': True,
-                'BLANK_LINE_BEFORE_NESTED_CLASS_OR_DEF': True,
-                'COALESCE_BRACKETS': True,
-                'COLUMN_LIMIT': 80,
-                'DEDENT_CLOSING_BRACKETS': True,
-                'DISABLE_ENDING_COMMA_HEURISTIC': False,
-                'EACH_DICT_ENTRY_ON_SEPARATE_LINE': True,
-                'FORCE_MULTILINE_DICT': False,
-                'INDENT_BLANK_LINES': True,
-                'INDENT_CLOSING_BRACKETS': False,
-                'INDENT_DICTIONARY_VALUE': True,
-                'JOIN_MULTIPLE_LINES': True,
-                'NO_SPACES_AROUND_SELECTED_BINARY_OPERATORS': True,
-                'SPACE_BETWEEN_ENDING_COMMA_AND_CLOSING_BRACKET': False,
-                'SPACES_BEFORE_COMMENT': 2,
-                'SPLIT_ARGUMENTS_WHEN_COMMA_TERMINATED': True,
-                'SPLIT_BEFORE_ARITHMETIC_OPERATOR': True,
-                'SPLIT_BEFORE_BITWISE_OPERATOR': True,
-                'SPLIT_BEFORE_CLOSING_BRACKET': False,
-                'SPLIT_BEFORE_DICT_SET_GENERATOR': True,
-                'SPLIT_BEFORE_DOT': True,
-                'SPLIT_BEFORE_EXPRESSION_AFTER_OPENING_PAREN': True,
-                'SPLIT_BEFORE_FIRST_ARGUMENT': True,
-                'SPLIT_BEFORE_LOGICAL_OPERATOR': False,
-                'SPLIT_COMPLEX_COMPREHENSION': True,
-            },
-        )
+    if _ndjson:
+        _emit_summary(root, check, len(file_ranges), cnt, [])
+    if not file_ranges:
+        print('[yellow dim]no changed python file found[/]', ':rt')
+    elif check:
+        if cnt == 0:
+            print(':rt', '[green dim]all done with no file would be changed[/]')
+        else:
+            print(':rt', f'[red][u]{cnt}[/] files would be reformatted[/]')
+    elif cnt == 0:
+        print(':rt', '[green dim]all done with no file changed[/]')
     else:
-        raise Exception(formatter)
+        print(':rt', f'[green]all done with [u]{cnt}[/] files changed[/]')
+    return root, cnt
+
+
+def _fmt_staged(
+    root: str,
+    files: t.Iterable[str],
+    sources: t.Dict[str, str],
+    inplace: bool,
+    formatter: str,
+    failures: t.List[t.Tuple[str, str]],
+) -> t.Iterator[t.Tuple[str, str, T.Changes]]:
+    """
+    format the staged content of files, write the result back to the index. -
+    the working tree file is overwritten only if it's the same as the staged -
+    one, otherwise the unstaged changes would be lost.
+    """
+    for f in files:
+        origin_code = sources[f]
+        try:
+            code = _fmt_code(origin_code, f, formatter)
+        except Exception as e:
+            failures.append((f, f'{type(e).__name__}: {e}'))
+            continue
+        if code == origin_code:
+            yield f, code, (0, 0, 0)
+            continue
+        if inplace:
+            vcs.write_staged(root, f, code)
+            if fileio.read(f) == origin_code:
+                fileio.write(f, code)
+            else:
+                print(
+                    '[yellow]{} has unstaged changes, only the staged '
+                    'content is reformatted[/]'.format(fs.relpath(f, root)),
+                    ':r',
+                )
+        with profiler.timer(f, 'stat_changes'):
+            changes = stat_changes(origin_code, code, verbose=False)
+        yield f, code, changes
+
+
+def _pipeline(
+    code: str, file: str, formatter: str, imports: bool = True
+) -> t.Iterator[t.Tuple[str, str]]:
+    """
+    run the formatting stages one by one.
     
-    code = lkf.join_oneline_if_stmt(code)
-    code = lkf.no_heavy_single_line(code)
-    code = lkf.keep_indents_on_empty_lines(code)
-    code = lkf.ensure_trailing_newline(code)
+    params:
+        imports: run autoflake and isort. turned off for range formatting, -
+            they need the whole module to decide. large modules are -
+            formatted by blocks only if it's on (see `blocks`).
+    yields: (stage, code)
+        the code after each stage. the last one is the final result. -
+        stages that cannot change the code (see `prescan`) are skipped.
+    """
+    if imports:
+        scan = prescan.scan(code)
+        yield 'prescan', code
     
-    if code == origin_code:
-        print('[green dim]no code change[/]', ':rt')
-        return code, (0, 0, 0)
+    # remove unused imports
+    if (
+        imports and
+        scan.autoflake and
+        not fs.filename(file) == '__init__.py'
+    ):  # fmt:skip
+        # we don't strip any import in `__init__.py`.
+        import autoflake
+        
+        code = autoflake.fix_code(code, **settings.AUTOFLAKE)
+        yield 'autoflake', code
     
-    if inplace:
-        with open(file, 'w', encoding='utf-8') as f:
-            f.write(code)
+    # sort imports
+    if imports and scan.isort:
+        import isort
+        
+        code = isort.code(code, config=_isort_config())
+        yield 'isort', code
     
-    i, u, d = stat_changes(origin_code, code, verbose=False)
-    print(
-        '[green]reformat code done: '
+    # main format code
+    if (
+        formatter == 'black' and
+        imports and
+        code.count('\n') >= blocks.MIN_LINES
+    ):  # fmt:skip
+        code, table = blocks.format_str(
+            code, backends.black_mode(), _cache.get_blocks(file), fingerprint()
+        )
+        _cache.set_blocks(file, table)
+    else:
+        code = backends.get(formatter)(code, file)
+    yield formatter, code
+    
+    yield 'lkflavored', lkf.apply(code)
+
+
+def _check_all(
+    root: str,
+    files: t.Iterable[str],
+    sources: t.Optional[t.Dict[str, str]],
+    jobs: int,
+    formatter: str,
+    budget: Budget,
+    failures: t.List[t.Tuple[str, str]],
+    entries: sharding.T.Entries,
+) -> int:
+    """
+    params:
+        entries: an empty dict, it will be filled with whether each file -
+            would be reformatted.
+    returns: count of files that would be reformatted.
+    """
+    keys = {}
+    codes = {}
+    files = _filter_formatted(
+        files, keys, formatter, sources, codes, failures
+    )
+    cnt = 0
+    if sources is None:
+        results = check_many(
+            files, jobs, budget, failures, codes, formatter=formatter
+        )
+    else:
+        results = _check_staged(files, sources, formatter, failures)
+    for f, changed in results:
+        entries[f] = changed
+        if _ndjson:
+            _emit_file(f, root, changed)
+        if changed:
+            cnt += 1
+            print(
+                '[yellow]would reformat: {}[/]'.format(fs.relpath(f, root)),
+                ':r',
+            )
+        else:
+            _cache.set(keys[f], keys[f])
+    failed = {f for f, _ in failures}
+    for f in keys:
+        if f not in entries and f not in failed:
+            entries[f] = False  # skipped by the cache.
+            if _ndjson:
+                _emit_file(f, root, False, cached=True)
+    if not keys:
+        print('[yellow dim]no python file found[/]', ':rt')
+        return 0
+    if cnt == 0:
+        print(':rt', '[green dim]all done with no file would be changed[/]')
+    else:
+        print(':rt', f'[red][u]{cnt}[/] files would be reformatted[/]')
+    _cache.save()
+    return cnt
+
+
+def _check_staged(
+    files: t.Iterable[str],
+    sources: t.Dict[str, str],
+    formatter: str,
+    failures: t.List[t.Tuple[str, str]],
+) -> t.Iterator[t.Tuple[str, bool]]:
+    for f in files:
+        try:
+            yield f, check_one(f, formatter, sources[f])
+        except Exception as e:
+            failures.append((f, f'{type(e).__name__}: {e}'))
+
+
+def _markup_changes(changes: T.Changes) -> str:
+    i, u, d = changes
+    if changes == (0, 0, 0):
+        return '[green dim]no code change[/]'
+    return (
         '[cyan {dim_i}]{i} insertions,[/] '
         '[yellow {dim_u}]{u} updates,[/] '
-        '[red {dim_d}]{d} deletions[/]'
-        '[/]'.format(
+        '[red {dim_d}]{d} deletions[/]'.format(
             dim_i='dim' if not i else '',
             dim_u='dim' if not u else '',
             dim_d='dim' if not d else '',
             i=str(i).rjust(2),
             u=str(u).rjust(2),
             d=str(d).rjust(2),
-        ),
-        ':rt',
+        )
     )
-    if quiet:
+
+
+def _report_profile(dump_file: t.Optional[str], root: str = None) -> None:
+    if not profiler.is_enabled(): return
+    profiler.report(root)
+    if dump_file:
+        profiler.dump(dump_file, root)
+
+
+def _report_failures(
+    failures: t.List[t.Tuple[str, str]],
+    dump_file: t.Optional[str],
+    root: str = None,
+) -> None:
+    if not failures and not dump_file: return
+    if failures:
+        print(':r', f'[red]{len(failures)} files failed and are skipped:[/]')
+        for f, reason in failures:
+            print(
+                ':r',
+                '    [red]{}[/] [dim]({})[/]'.format(
+                    fs.relpath(f, root) if root else f, reason
+                ),
+            )
+    if dump_file:
+        dumps(
+            {
+                'version': 1,
+                'failures': [
+                    {'file': fs.relpath(f, root) if root else f, 'reason': r}
+                    for f, r in failures
+                ],
+            },
+            dump_file,
+            'json',
+        )
+        print(f'[dim]failures saved to {dump_file}[/]', ':r')
+
+
+@contextmanager
+def _output(format: str) -> t.Iterator[None]:
+    """
+    in 'ndjson' format, the logger is muted for the whole block, stdout is -
+    for the records only (see `_emit`).
+    """
+    global _ndjson
+    if format == 'rich':
+        yield
+        return
+    if format != 'ndjson':
+        raise ValueError(f'unknown format: {format}, expect "rich" or "ndjson"')
+    _ndjson = True
+    lk_logger.mute()
+    try:
+        yield
+    finally:
+        _ndjson = False
         lk_logger.unmute()
-    return code, (i, u, d)
+        sys.stdout.flush()
+
+
+def _emit(record: dict) -> None:
+    # stdout is block buffered when piped, records are flushed in batches.
+    sys.stdout.write(
+        json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+    )
+
+
+def _emit_file(
+    file: str,
+    root: str,
+    changes: t.Union[T.Changes, bool],
+    cached: bool = False,
+) -> None:
+    """
+    params:
+        changes: (insertions, updates, deletions), or whether the file would -
+            be reformatted in check mode.
+        cached: the file is skipped by the cache, no stage is run.
+    """
+    record = {'type': 'file', 'file': fs.relpath(file, root)}
+    if isinstance(changes, bool):
+        record['changed'] = changes
+    else:
+        i, u, d = changes
+        record.update(
+            changed=any(changes), insertions=i, updates=u, deletions=d
+        )
+    if cached:
+        record['cached'] = True
+    else:
+        record['stages'] = {
+            k: round(v, 6) for k, v in (profiler.get(file) or {}).items()
+        }
+    _emit(record)
+
+
+def _emit_summary(
+    root: str,
+    check: bool,
+    total: int,
+    changed: int,
+    failures: t.List[t.Tuple[str, str]],
+) -> None:
+    for f, reason in failures:
+        _emit({'type': 'failure', 'file': fs.relpath(f, root), 'error': reason})
+    _emit(
+        {
+            'type': 'summary',
+            'check': check,
+            'files': total + len(failures),
+            'changed': changed,
+            'failed': len(failures),
+        }
+    )
+
+
+def _find_files(
+    target: str,
+    recursive: bool = False,
+    exclude: t.Iterable[str] = (),
+    suffixes: t.Tuple[str, ...] = settings.SUFFIXES,
+) -> t.Tuple[str, t.Iterable[str]]:
+    """
+    params:
+        suffixes: the files to take from a dir. a file target is taken as is.
+    returns: (root, files)
+        files: for a dir target, it's an iterator streaming from `walker.walk`.
+    """
+    if target == '.':
+        root = fs.abspath(os.getcwd())
+    elif os.path.isdir(target):
+        root = fs.abspath(target)
+    elif os.path.isfile(target):
+        return fs.abspath(os.path.dirname(fs.abspath(target))), [target]
+    else:
+        raise ValueError(f'invalid target: {target}')
+    return root, walker.walk(
+        root,
+        recursive,
+        exclude=(*settings.EXCLUDE, *exclude),
+        suffixes=suffixes,
+    )
+
+
+def _filter_formatted(
+    files: t.Iterable[str],
+    keys: t.Dict[str, str],
+    formatter: str = 'black',
+    sources: t.Dict[str, str] = None,
+    codes: t.Dict[str, str] = None,
+    failures: t.List[t.Tuple[str, str]] = None,
+) -> t.Iterator[str]:
+    """
+    filter out files which are known to be formatted.
+    
+    params:
+        keys: an empty dict, it will be filled with the digests of all given -
+            files (`dict[file, digest]`). use it to update the cache after -
+            formatting.
+        sources: dict[file, code]. if given, use it instead of reading files.
+        codes: an empty dict, it will be filled with the content of the -
+            yielded files, so they don't have to be read again. the consumer -
+            should pop the items it takes, see `parallel.fmt_many`.
+        failures: a list to be filled with the files failed to read or -
+            digest (`list[tuple[file, reason]]`), they are skipped and not -
+            put in `keys`. if not given, the error is raised.
+    yields: files which need to be formatted.
+    """
+    if sources:
+        pairs = ((f, sources[f]) for f in files)
+    else:
+        # files are read ahead in a thread, see `fileio.prefetch`.
+        pairs = fileio.prefetch(files, failures=failures)
+    for f, code in pairs:
+        try:
+            with profiler.timer(f, 'cache'):
+                key = digest(code, f, formatter)
+        except Exception as e:
+            if failures is None:
+                raise
+            failures.append((f, f'{type(e).__name__}: {e}'))
+            continue
+        keys[f] = key
+        if not _cache.is_formatted(key):
+            if codes is not None:
+                codes[f] = code
+            yield f
+
+
+def warmup(formatter: str = 'black') -> None:
+    """
+    import the formatter and build its config objects ahead of time.
+    used by long-lived processes (e.g. the workers of `fmt_all(jobs=...)`).
+    """
+    import autoflake  # noqa
+    
+    _isort_config()
+    # black is also used by `lkflavored.no_heavy_single_line`.
+    backends.get('black')
+    backends.get(formatter)
+
+
+@lru_cache()
+def _isort_config() -> 'isort.Config':
+    import isort
+    
+    return isort.Config(**settings.ISORT)
@@ -1,15 +1,33 @@
 import re
 import typing as t
+from collections import OrderedDict
+from collections import deque
+from functools import lru_cache
 from textwrap import dedent
 from textwrap import indent
 
-import black
-import libcst as cst
+from . import settings
+
+
+class T:
+    Lines = t.Iterator[str]
+    Rule = t.Callable[[Lines], Lines]
+
 
 _re_leading_spaces = re.compile(r'^ *')
+_rules: t.Dict[str, T.Rule] = {}
+
+_HEAVY_LINE_MEMO_SIZE = 4096
+# dict[stripped_line, optional[dedented_snippet]]. see `_reformat_heavy_line`.
+_heavy_line_memo: 't.OrderedDict[str, t.Optional[str]]' = OrderedDict()
+# black keeps a simple statement on its own line, so we use one to split the -
+# batch of heavy lines.
+_heavy_line_separator = '__lkfmt_heavy_line__()\n'
 
 
 def fixture(code: str):
+    import libcst as cst
+    
     module = cst.parse_module(code)
     
     _flag = 'ready'
@@ -35,6 +53,46 @@ def fixture(code: str):
         pass
 
 
+def apply(code: str, rules: t.Iterable[str] = None) -> str:
+    """
+    run lk-flavored rules on `code` in one pass.
+    
+    the rules are chained as generators over a shared line stream: every line -
+    flows through all rules before the next one is read, and each rule keeps -
+    only a small lookahead window (see `_lookahead`). the code is split and -
+    joined only once, no matter how many rules there are.
+    
+    params:
+        rules: names of registered rules. default to all of them, in the order -
+            of registration.
+    """
+    rules = tuple(rules or _rules)
+    if 'no_heavy_single_line' in rules:
+        _prefetch_heavy_lines(code)
+    return ensure_trailing_newline(_run(code, (_rules[x] for x in rules)))
+
+
+def register_rule(name: str) -> t.Callable[[T.Rule], T.Rule]:
+    """
+    register a line rule for `apply`. a rule takes the line stream and yields -
+    the output lines. for example:
+        @register_rule('expand_tabs')
+        def _expand_tabs(lines):
+            for line in lines:
+                yield line.expandtabs(4)
+    """
+    
+    def decorator(rule: T.Rule) -> T.Rule:
+        _rules[name] = rule
+        return rule
+    
+    return decorator
+
+
+# -----------------------------------------------------------------------------
+# standalone passes
+
+
 def ensure_trailing_newline(code: str) -> str:
     if not code.endswith('\n'):
         code += '\n'
@@ -49,38 +107,7 @@ def join_oneline_if_stmt(code: str) -> str:
     after:
         if x: return 1
     """
-    
-    def walk() -> t.Iterator[str]:
-        flag = False
-        for l0, l1, l2, l3, l4 in _continous_window(code.splitlines(), 5):
-            if flag:
-                flag = False
-                continue
-            if l0.lstrip().startswith('if '):
-                if l1 and len(l1) < 20 and not l1.lstrip().startswith('if '):
-                    i0, i1, i2, i3, i4 = tuple(
-                        map(
-                            len,
-                            (
-                                _re_leading_spaces.match(x).group()
-                                for x in (l0, l1, l2, l3, l4)
-                            ),
-                        )
-                    )
-                    if i0 < i1:
-                        if (
-                            (l2 and i2 < i1)
-                            or (l3 and i3 < i1)
-                            or (l4 and i4 < i1)
-                        ):
-                            out = '{} {}'.format(l0, l1.lstrip())
-                            if len(out) < 80:
-                                flag = True
-                                yield out
-                                continue
-            yield l0
-    
-    return '\n'.join(walk())
+    return _run(code, (_join_oneline_if_stmt,))
 
 
 def keep_indents_on_empty_lines(code: str) -> str:
@@ -92,16 +119,7 @@ def keep_indents_on_empty_lines(code: str) -> str:
         def bar():      |       def bar():
             pass        |           pass
     """
-    
-    def walk() -> t.Iterator[str]:
-        for curr, next in _continous_window(code.splitlines(), 2):
-            if curr == '':
-                if next and next.startswith(' '):
-                    yield _keep_indent(curr, next)
-                    continue
-            yield curr
-    
-    return '\n'.join(walk())
+    return _run(code, (_keep_indents_on_empty_lines,))
 
 
 def no_heavy_single_line(code: str) -> str:
@@ -128,110 +146,260 @@ def no_heavy_single_line(code: str) -> str:
             cccccc, dddddddd, eeeeeeeeeeeeeeee
         )
     """
-    
-    def walk() -> t.Iterator[str]:
-        line: int
-        prev: str
-        curr: str
-        next: str
-        
-        def is_heavy_line() -> bool:
-            if prev.endswith('(') and next.lstrip().startswith(')'):
-                if len(curr) > 70 and len(curr.strip()) > 40:
-                    if len(prev.strip()) < 10 and len(next.strip()) < 10:
-                        return True
-            return False
-        
-        def is_triple_quotes() -> bool:
-            # this is not a strict check, but it's enough for now.
-            return (curr.lstrip().startswith(('"""', "'''")) or
-                    curr.endswith(('"""', "'''")))  # fmt:skip
-        
-        is_processing = True
-        
-        for line, (prev, curr, next) in enumerate(
-            _continous_window(code.splitlines(), 3, prepad=1)
-        ):
-            if curr.lstrip().startswith('#'):
-                yield curr
-                continue
-            if is_triple_quotes():
-                is_processing = not is_processing
-                yield curr
-                continue
-            if not is_processing:
-                yield curr
-                continue
-            
-            if is_heavy_line():
-                print(
-                    ':i2sv',
-                    'detected heavy line',
-                    _re_leading_spaces.sub(
-                        lambda m: m.group().replace(' ', '.'), curr
-                    ),
-                )
-                try:
-                    snippet = black.format_str(
-                        'foo(\n    {}\n)'.format(curr.lstrip()),
-                        mode=black.Mode(
-                            line_length=50,
-                            string_normalization=False,
-                            magic_trailing_comma=True,
-                            preview=True,
+    _prefetch_heavy_lines(code)
+    return _run(code, (_no_heavy_single_line,))
+
+
+# -----------------------------------------------------------------------------
+# rules (line stream plugins). the registration order is the order they run.
+
+
+@register_rule('join_oneline_if_stmt')
+def _join_oneline_if_stmt(lines: T.Lines) -> T.Lines:
+    flag = False
+    for l0, l1, l2, l3, l4 in _lookahead(lines, 5):
+        if flag:
+            flag = False
+            continue
+        if l0.lstrip().startswith('if '):
+            if l1 and len(l1) < 20 and not l1.lstrip().startswith('if '):
+                i0, i1, i2, i3, i4 = tuple(
+                    map(
+                        len,
+                        (
+                            _re_leading_spaces.match(x).group()
+                            for x in (l0, l1, l2, l3, l4)
                         ),
                     )
-                except Exception:
-                    yield curr
-                    continue
-                snippet = snippet.splitlines()[1:-1]
-                snippet = indent(
-                    dedent('\n'.join(snippet)),
-                    _re_leading_spaces.match(curr).group(),
                 )
-                yield snippet
-            else:
-                yield curr
-    
-    return '\n'.join(walk())
+                if i0 < i1:
+                    if (l2 and i2 < i1) or (l3 and i3 < i1) or (l4 and i4 < i1):
+                        out = '{} {}'.format(l0, l1.lstrip())
+                        if len(out) < 80:
+                            flag = True
+                            yield out
+                            continue
+        yield l0
+
+
+@register_rule('no_heavy_single_line')
+def _no_heavy_single_line(lines: T.Lines) -> T.Lines:
+    for curr, heavy in _scan_heavy_lines(lines):
+        if heavy:
+            print(
+                ':i2sv',
+                'detected heavy line',
+                _re_leading_spaces.sub(
+                    lambda m: m.group().replace(' ', '.'), curr
+                ),
+            )
+            if (snippet := _reformat_heavy_line(curr.lstrip())) is not None:
+                yield from indent(
+                    snippet, _re_leading_spaces.match(curr).group()
+                ).split('\n')
+                continue
+        yield curr
+
+
+@register_rule('keep_indents_on_empty_lines')
+def _keep_indents_on_empty_lines(lines: T.Lines) -> T.Lines:
+    for curr, next in _lookahead(lines, 2):
+        if curr == '':
+            if next and next.startswith(' '):
+                yield _keep_indent(curr, next)
+                continue
+        yield curr
 
 
 # -----------------------------------------------------------------------------
 
 
+def _scan_heavy_lines(lines: T.Lines) -> t.Iterator[t.Tuple[str, bool]]:
+    """
+    yields: (line, is_heavy)
+    """
+    prev: str
+    curr: str
+    next: str
+    
+    def is_heavy_line() -> bool:
+        if prev.endswith('(') and next.lstrip().startswith(')'):
+            if len(curr) > 70 and len(curr.strip()) > 40:
+                if len(prev.strip()) < 10 and len(next.strip()) < 10:
+                    return True
+        return False
+    
+    def is_triple_quotes() -> bool:
+        # this is not a strict check, but it's enough for now.
+        return (curr.lstrip().startswith(('"""', "'''")) or
+                curr.endswith(('"""', "'''")))  # fmt:skip
+    
+    is_processing = True
+    for prev, curr, next in _lookahead(lines, 3, prepad=1):
+        if curr.lstrip().startswith('#'): pass
+        elif is_triple_quotes():
+            is_processing = not is_processing
+        elif is_processing and is_heavy_line():
+            yield curr, True
+            continue
+        yield curr, False
+
+
+def _prefetch_heavy_lines(code: str) -> None:
+    """
+    reformat the heavy lines of `code` in one black run, ahead of the line -
+    stream. the snippets go to `_heavy_line_memo`, where -
+    `_reformat_heavy_line` finds them.
+    the scan is on the input of the rules, a line which is changed by an -
+    upstream rule is missed here and formatted on its own.
+    """
+    todo = tuple(
+        dict.fromkeys(
+            x.lstrip()
+            for x, heavy in _scan_heavy_lines(iter(code.splitlines()))
+            if heavy and x.lstrip() not in _heavy_line_memo
+        )
+    )[:_HEAVY_LINE_MEMO_SIZE]
+    if len(todo) < 2: return
+    import black
+    
+    try:
+        output = black.format_str(
+            _heavy_line_separator.join(map(_wrap_heavy_line, todo)),
+            mode=_heavy_line_mode(),
+        )
+    except Exception:
+        return  # the lines are formatted one by one then.
+    outputs = output.split(_heavy_line_separator)
+    if len(outputs) != len(todo):
+        return
+    for line, output in zip(todo, outputs):
+        _remember_heavy_line(line, _unwrap_heavy_line(output))
+
+
+def _reformat_heavy_line(line: str) -> t.Optional[str]:
+    """
+    reformat a heavy line (without leading spaces) by black, wrapped in a -
+    function call `foo(...)` with a narrow line length.
+    results are memoized (see `_heavy_line_memo`), and `apply` formats the -
+    heavy lines of the code in one batch beforehand (see -
+    `_prefetch_heavy_lines`).
+    
+    returns: the dedented snippet, or None if black fails on the line, then -
+        it's kept as is.
+    """
+    if line in _heavy_line_memo:
+        _heavy_line_memo.move_to_end(line)
+        return _heavy_line_memo[line]
+    import black
+    
+    try:
+        output = black.format_str(
+            _wrap_heavy_line(line), mode=_heavy_line_mode()
+        )
+    except Exception:
+        snippet = None
+    else:
+        snippet = _unwrap_heavy_line(output)
+    _remember_heavy_line(line, snippet)
+    return snippet
+
+
+def _remember_heavy_line(line: str, snippet: t.Optional[str]) -> None:
+    _heavy_line_memo[line] = snippet
+    while len(_heavy_line_memo) > _HEAVY_LINE_MEMO_SIZE:
+        _heavy_line_memo.popitem(last=False)
+
+
+@lru_cache()
+def _heavy_line_mode() -> 'black.Mode':
+    import black
+    
+    # target versions are pinned, so a line is formatted the same in a batch -
+    # or alone. all versions is what black infers for a line that uses no -
+    # version specific syntax.
+    return black.Mode(
+        **settings.BLACK_HEAVY_LINE, target_versions=set(black.TargetVersion)
+    )
+
+
+def _wrap_heavy_line(line: str) -> str:
+    return 'foo(\n    {}\n)\n'.format(line)
+
+
+def _unwrap_heavy_line(output: str) -> str:
+    return dedent('\n'.join(output.strip('\n').splitlines()[1:-1]))
+
+
 def _keep_indent(target: str, base: str) -> str:
     return _re_leading_spaces.match(base).group() + target
 
 
-def _window(
-    seq: t.List[str], n: int, prepad: int = 0
+def _lookahead(
+    lines: t.Iterable[str], n: int, prepad: int = 0
 ) -> t.Iterator[t.Tuple[str, ...]]:
     """
+    a sliding window over a line stream, backed by a ring buffer.
+    the window moves one line a step, from the one starting with the -
+    paddings, to the one starting with the last line. missing neighbors at -
+    both ends are filled with empty strings.
     for example:
-        _window((1, 2, 3, 4, 5), 3)
-            -> ((1, 2, 3), (4, 5, None))
+        _lookahead(('a', 'b', 'c'), 3, prepad=1)
+            -> (('', 'a', 'b'), ('a', 'b', 'c'), ('b', 'c', ''), ('c', '', ''))
     """
-    assert 0 <= prepad < n <= len(seq), (len(seq), n, prepad)
-    seq_fill = [None] * prepad + seq.copy() + [None] * n
-    for i in range(0, len(seq_fill), n):
-        win = seq_fill[i : i + n]
-        if all(x is None for x in win): break
-        yield (x or '' for x in win)
-        if win[-1] is None: break
+    assert 0 <= prepad < n, (n, prepad)
+    win = deque(('',) * prepad, maxlen=n)
+    total = yielded = 0
+    for line in lines:
+        total += 1
+        win.append(line)
+        if len(win) == n:
+            yielded += 1
+            yield tuple(win)
+    if total:
+        total += prepad
+    while yielded < total:
+        win.append('')
+        if len(win) == n:
+            yielded += 1
+            yield tuple(win)
+
+
+def _run(code: str, rules: t.Iterable[T.Rule]) -> str:
+    stream = iter(code.splitlines())
+    for i, rule in enumerate(rules):
+        if i > 0:
+            stream = _drop_last_empty_line(stream)
+        stream = rule(stream)
+    return '\n'.join(stream)
+
+
+def _drop_last_empty_line(lines: T.Lines) -> T.Lines:
+    """
+    behave the same as if the upstream rule was a separate pass: -
+    `'\\n'.join(lines).splitlines()` drops one trailing empty line.
+    """
+    last = None
+    for line in lines:
+        if last is not None:
+            yield last
+        last = line
+    if last: yield last
 
 
-def _continous_window(
+def _window(
     seq: t.List[str], n: int, prepad: int = 0
 ) -> t.Iterator[t.Tuple[str, ...]]:
     """
     for example:
-        _continous_window((1, 2, 3, 4, 5), 3)
-            -> ((1, 2, 3), (2, 3, 4), (3, 4, 5))
+        _window((1, 2, 3, 4, 5), 3)
+            -> ((1, 2, 3), (4, 5, None))
     """
     assert 0 <= prepad < n <= len(seq), (len(seq), n, prepad)
     seq_fill = [None] * prepad + seq.copy() + [None] * n
-    for i in range(0, len(seq_fill)):
+    for i in range(0, len(seq_fill), n):
         win = seq_fill[i : i + n]
         if all(x is None for x in win): break
-        # at least one element is not None in `win`.
         yield (x or '' for x in win)
+        if win[-1] is None:
+            break
@@ -0,0 +1,164 @@
+"""
+format the code cells of jupyter notebooks (`.ipynb`).
+
+the code cells of a notebook are joined into one module, with a marker line -
+between two cells, and go through the pipeline in one call. it's faster than -
+one call per cell, and autoflake sees the whole notebook, so an import used -
+by a later cell is not taken as unused. the result is split back at the -
+markers, the blank lines black puts around them are dropped.
+
+ipython syntax is not python, it's masked before formatting and restored -
+after:
+    - line magics, shell commands and help (`%time f()`, `!ls`, `x = !ls`, -
+        `obj?`) are replaced by a placeholder call.
+    - cells starting with a cell magic (`%%time`) are left as is, their body -
+        may not be python at all.
+    - a trailing `;` (which hides the output of the last line) is kept.
+
+only the `source` of code cells is touched. outputs, metadata and the other -
+cells are dumped back as they are loaded, the json layout (indent, key -
+order, escaping of non-ascii chars) follows the original file.
+"""
+import json
+import re
+import typing as t
+
+
+class T:
+    Cell = t.Dict[str, t.Any]
+    # (placeholders' origin lines, trailing semicolon)
+    Masked = t.Tuple[t.List[str], bool]
+
+
+# black keeps a simple statement on its own line, so we use one to split the -
+# batch.
+_cell_separator = '__lkfmt_cell__()'
+_magic_prefix = '__lkfmt_magic_'
+_re_magic = re.compile(
+    r'^[ \t]*(?:[%!?]|[\w.]+[ \t]*=[ \t]*[%!]|[\w.]+\?\??[ \t]*$)'
+)
+_re_placeholder = re.compile(r'^([ \t]*)__lkfmt_magic_(\d+)__\(\)$')
+
+
+def fmt_notebook(text: str, format_code: t.Callable[[str], str]) -> str:
+    """
+    params:
+        text: the json content of a notebook.
+        format_code: formats a module, e.g. `lambda x: _fmt_code(x, ...)`.
+    returns: the new json content. if no cell is changed, it's `text` itself.
+    """
+    nb = json.loads(text)
+    if not _is_python(nb): return text
+    
+    cells: t.List[T.Cell] = []
+    sources: t.List[str] = []
+    masks: t.List[T.Masked] = []
+    for cell in nb.get('cells', ()):
+        if cell.get('cell_type') != 'code':
+            continue
+        source = _join(cell.get('source', ''))
+        if (masked := _mask(source)) is None:
+            continue
+        cells.append(cell)
+        sources.append(masked[0])
+        masks.append(masked[1])
+    if not cells: return text
+    
+    code = format_code(''.join(f'{x}\n{_cell_separator}\n' for x in sources))
+    outputs = _split(code)
+    # the last item is what follows the last separator, i.e. empty.
+    if len(outputs) != len(cells) + 1 or outputs[-1].strip():
+        raise ValueError('cell separators are changed by the formatters')
+    
+    changed = False
+    for cell, output, mask in zip(cells, outputs, masks):
+        new = _unmask(output.strip('\n'), mask)
+        old = _join(cell['source'])
+        if new != old:
+            cell['source'] = (
+                new.splitlines(keepends=True)
+                if isinstance(cell['source'], list)
+                else new
+            )
+            changed = True
+    if not changed: return text
+    return _dump(nb, text)
+
+
+def _is_python(nb: dict) -> bool:
+    meta = nb.get('metadata', {})
+    language = (
+        meta.get('language_info', {}).get('name') or
+        meta.get('kernelspec', {}).get('language') or
+        'python'
+    )  # fmt:skip
+    return language.lower() == 'python'
+
+
+def _join(source: t.Union[str, t.List[str]]) -> str:
+    return source if isinstance(source, str) else ''.join(source)
+
+
+def _mask(source: str) -> t.Optional[t.Tuple[str, T.Masked]]:
+    """
+    returns: (masked_source, (magics, semicolon)), or None if the cell should -
+        be left as is: empty, a cell magic, a multi-line magic, or it has our -
+        own names in it already.
+    """
+    if (
+        not source.strip() or
+        source.lstrip().startswith('%%') or
+        _magic_prefix in source or
+        _cell_separator in source
+    ):  # fmt:skip
+        return None
+    magics = []
+    lines = source.splitlines()
+    for i, line in enumerate(lines):
+        if _re_magic.match(line):
+            if line.endswith('\\'):
+                return None
+            stripped = line.lstrip()
+            lines[i] = '{}{}{}__()'.format(
+                line[: len(line) - len(stripped)], _magic_prefix, len(magics)
+            )
+            magics.append(stripped)
+    return '\n'.join(lines), (magics, source.rstrip().endswith(';'))
+
+
+def _split(code: str) -> t.List[str]:
+    out = ['']
+    for line in code.splitlines(keepends=True):
+        if line.rstrip('\n') == _cell_separator:
+            out.append('')
+        else:
+            out[-1] += line
+    return out
+
+
+def _unmask(code: str, mask: T.Masked) -> str:
+    magics, semicolon = mask
+    lines = code.split('\n')
+    found = 0
+    for i, line in enumerate(lines):
+        if m := _re_placeholder.match(line):
+            lines[i] = m.group(1) + magics[int(m.group(2))]
+            found += 1
+    if found != len(magics):
+        raise ValueError('magic placeholders are changed by the formatters')
+    if semicolon and not lines[-1].endswith(';'):
+        lines[-1] += ';'
+    return '\n'.join(lines)
+
+
+def _dump(nb: dict, origin: str) -> str:
+    """
+    dump the notebook in the layout of the origin text. nbformat writes -
+    `indent=1` and non-ascii chars as is, other tools may differ.
+    """
+    second_line = origin.split('\n', 2)[1] if '\n' in origin else ''
+    indent = len(second_line) - len(second_line.lstrip(' ')) or None
+    # an all-ascii origin either escapes non-ascii chars or has none, -
+    # escaping gives the same text in both cases.
+    text = json.dumps(nb, indent=indent, ensure_ascii=origin.isascii())
+    return text + '\n' if origin.endswith('\n') else text
@@ -0,0 +1,414 @@
+"""
+process-pool engine for `fmt_all`.
+
+black, isort and autoflake are cpu-bound pure python, so we spread files -
+across worker processes. each worker imports the formatters once (see -
+`_init_worker`) and keeps the `isort.Config`/`black.Mode` objects alive for -
+all the files it receives.
+
+files are isolated from each other: a file that raises, runs out of its time -
+budget, or kills its worker (e.g. by running out of memory) is recorded as a -
+failure and skipped, the worker is replaced and the run goes on.
+
+workers are started by a fork server (or spawned where there is none), not -
+forked from the main process: the main process runs reader and writer -
+threads (see `fileio`) by the time the pool starts, and forking a process -
+with threads may leave a lock held forever in the child. so nothing is -
+inherited, a worker gets what it needs from `_serve`'s arguments.
+"""
+import os
+import signal
+import time
+import typing as t
+from functools import lru_cache
+from multiprocessing import get_all_start_methods
+from multiprocessing import get_context
+from multiprocessing.connection import Connection
+from multiprocessing.connection import wait
+from multiprocessing.context import BaseContext
+
+import lk_logger
+
+from . import backends
+from . import profiler
+from .diff import T
+
+_task: t.Dict[str, t.Any] = {'cache': None, 'func': None, 'kwargs': {}}
+
+
+class Budget(t.NamedTuple):
+    # seconds per file.
+    timeout: t.Optional[float] = None
+    # megabytes of address space per worker process.
+    max_memory: t.Optional[int] = None
+
+
+def fmt_many(
+    files: t.Iterable[str],
+    jobs: int = 0,
+    budget: Budget = Budget(),
+    failures: t.List[t.Tuple[str, str]] = None,
+    sources: t.Dict[str, str] = None,
+    **kwargs,
+) -> t.Iterator[t.Tuple[str, str, T.Changes]]:
+    """
+    format files in a process pool.
+    
+    params:
+        files: a sequence, or an iterator (e.g. from `walker.walk`). for the -
+            latter, workers start on the first files while the rest are still -
+            being found.
+        jobs: number of worker processes. 0 means `os.cpu_count()`. 1 means -
+            formatting in the current process, unless a budget is set.
+        budget: limits for each file. files beyond the limits are killed -
+            and reported as failures.
+        failures: an empty list, it will be filled with the failed files -
+            (`list[tuple[file, reason]]`). they are not yielded. if not -
+            given, the first failure raises a `RuntimeError`.
+        sources: dict[file, code], the content of files that are read -
+            already (it may be filled while `files` is being iterated). a -
+            file found here is popped and sent to its worker along with the -
+            path, instead of being read again.
+        kwargs: passed to `fmt_one`.
+    yields: (file, code, changes)
+        the order is the same as `files`, no matter which worker finishes -
+        first.
+    """
+    for f, (code, changes) in _map(
+        'fmt_one',
+        files,
+        jobs,
+        {**kwargs, 'quiet': True},
+        budget,
+        failures,
+        sources,
+    ):
+        yield f, code, changes
+
+
+def check_many(
+    files: t.Iterable[str],
+    jobs: int = 0,
+    budget: Budget = Budget(),
+    failures: t.List[t.Tuple[str, str]] = None,
+    sources: t.Dict[str, str] = None,
+    **kwargs,
+) -> t.Iterator[t.Tuple[str, bool]]:
+    """
+    the same as `fmt_many`, but calls `check_one`.
+    
+    yields: (file, changed)
+    """
+    yield from _map('check_one', files, jobs, kwargs, budget, failures, sources)
+
+
+def _map(
+    func_name: str,
+    files: t.Iterable[str],
+    jobs: int,
+    kwargs: dict,
+    budget: Budget,
+    failures: t.Optional[t.List[t.Tuple[str, str]]],
+    sources: t.Optional[t.Dict[str, str]] = None,
+) -> t.Iterator[t.Tuple[str, t.Any]]:
+    def fail(file: str, reason: str) -> None:
+        if failures is None:
+            raise RuntimeError(f'failed to format {file}: {reason}')
+        failures.append((file, reason))
+    
+    jobs = jobs or os.cpu_count() or 1
+    if isinstance(files, t.Sized):
+        jobs = min(jobs, len(files))
+    if jobs <= 1 and budget == Budget():
+        from . import formatter
+        
+        func = getattr(formatter, func_name)
+        for f in files:
+            kw = _with_code(kwargs, sources, f)
+            if failures is None:
+                yield f, func(f, **kw)
+                continue
+            try:
+                result = func(f, **kw)
+            except Exception as e:
+                fail(f, f'{type(e).__name__}: {e}')
+            else:
+                yield f, result
+        return
+    
+    from .formatter import _cache
+    
+    pool = _Pool(max(1, jobs), func_name, kwargs, budget)
+    try:
+        for f, (ok, result, record, blocks) in pool.map(files, sources):
+            profiler.collect(f, record)
+            if blocks:
+                _cache.set_blocks(f, blocks)
+            if ok:
+                yield f, result
+            else:
+                fail(f, result)
+    finally:
+        pool.close()
+
+
+class _Worker:
+    def __init__(self, func_name: str, kwargs: dict, budget: Budget) -> None:
+        from . import formatter
+        
+        ctx = _get_context()
+        name = kwargs.get('formatter', 'black')
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_serve,
+            args=(
+                child_conn,
+                func_name,
+                kwargs,
+                profiler.is_enabled(),
+                budget.max_memory,
+                formatter._cache.location,
+                # a backend registered at runtime (not by an entry point) -
+                # only exists in the main process. its factory is pickled by -
+                # reference, the worker imports its module.
+                (name, backends._backends.get(name)),
+                {'_debug': formatter._debug, '_ndjson': formatter._ndjson},
+            ),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        # (index, file, deadline)
+        self.task: t.Optional[t.Tuple[int, str, float]] = None
+    
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class _Pool:
+    """
+    a minimal process pool. unlike `concurrent.futures.ProcessPoolExecutor`, -
+    a worker can be killed (on timeout) or die (e.g. killed by the oom -
+    killer) without breaking the pool, only the file it was working on fails.
+    """
+    
+    def __init__(
+        self, jobs: int, func_name: str, kwargs: dict, budget: Budget
+    ) -> None:
+        self._budget = budget
+        self._func_name = func_name
+        self._jobs = jobs
+        self._kwargs = kwargs
+        self._workers: t.List[_Worker] = []
+    
+    def map(
+        self,
+        files: t.Iterable[str],
+        sources: t.Optional[t.Dict[str, str]] = None,
+    ) -> t.Iterator[t.Tuple[str, tuple]]:
+        """
+        params:
+            sources: see `fmt_many`.
+        yields: (file, (ok, result_or_reason, profile_record, blocks))
+            in the order of `files`.
+        """
+        pending = enumerate(files)
+        exhausted = False
+        done: t.Dict[int, t.Tuple[str, tuple]] = {}
+        next_index = 0
+        timeout = self._budget.timeout
+        
+        while True:
+            # hand out files to idle workers, start new workers if needed.
+            while not exhausted:
+                worker = next((w for w in self._workers if not w.task), None)
+                if worker is None and len(self._workers) >= self._jobs:
+                    break
+                if (item := next(pending, None)) is None:
+                    exhausted = True
+                    break
+                if worker is None:
+                    worker = _Worker(
+                        self._func_name, self._kwargs, self._budget
+                    )
+                    self._workers.append(worker)
+                i, f = item
+                worker.task = (
+                    i,
+                    f,
+                    time.monotonic() + timeout if timeout else float('inf'),
+                )
+                worker.conn.send(
+                    (f, sources.pop(f, None) if sources is not None else None)
+                )
+            
+            busy = [w for w in self._workers if w.task]
+            if not busy:
+                break
+            
+            deadline = min(w.task[2] for w in busy)
+            ready = wait(
+                [w.conn for w in busy],
+                (
+                    None
+                    if deadline == float('inf')
+                    else max(0.0, deadline - time.monotonic())
+                ),
+            )
+            now = time.monotonic()
+            for w in busy:
+                i, f, deadline = w.task
+                if w.conn in ready:
+                    try:
+                        done[i] = (f, w.conn.recv())
+                        w.task = None
+                        continue
+                    except (EOFError, OSError):
+                        w.process.join()
+                        reason = _describe_exit(w.process.exitcode)
+                        if self._budget.max_memory:
+                            reason += ', max_memory is {}MB'.format(
+                                self._budget.max_memory
+                            )
+                elif now >= deadline:
+                    reason = f'timed out after {timeout}s'
+                else:
+                    continue
+                w.kill()
+                self._workers.remove(w)
+                done[i] = (f, (False, reason, None, None))
+            
+            while next_index in done:
+                yield done.pop(next_index)
+                next_index += 1
+    
+    def close(self) -> None:
+        for w in self._workers:
+            if w.task:
+                w.kill()
+            else:
+                try:
+                    w.conn.send(None)
+                except OSError:
+                    pass
+        for w in self._workers:
+            w.process.join(1)
+            if w.process.is_alive():
+                w.kill()
+        self._workers.clear()
+
+
+@lru_cache()
+def _get_context() -> BaseContext:
+    if 'forkserver' not in get_all_start_methods():
+        return get_context('spawn')
+    ctx = get_context('forkserver')
+    # the server imports lkfmt once, workers are forked from it with the -
+    # module loaded. the formatters are still imported by each worker, in -
+    # `_init_worker`.
+    ctx.set_forkserver_preload(['lkfmt.formatter'])
+    return ctx
+
+
+def _serve(
+    conn: Connection,
+    func_name: str,
+    kwargs: dict,
+    profile: bool,
+    max_memory: t.Optional[int],
+    cache_location: t.Tuple[t.Optional[str], str],
+    backend: t.Tuple[str, t.Optional[backends.Backend]],
+    flags: t.Dict[str, bool],
+) -> None:
+    """
+    the main loop of a worker process: receive a file, send back the result -
+    of `_work`, until a None is received.
+    a task is `(file, code)`, code is None if the worker should read the -
+    file itself.
+    
+    params:
+        backend: (name, backend). the backend the files are formatted by, -
+            registered in the worker if it's not there.
+        flags: the module level flags of `formatter` in the main process.
+    """
+    _init_worker(func_name, kwargs, profile, cache_location, backend, flags)
+    if max_memory:
+        import resource
+        
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory * 1024 * 1024, hard))
+    try:
+        while (task := conn.recv()) is not None:
+            conn.send(_work(*task))
+    except (EOFError, KeyboardInterrupt):
+        pass
+
+
+def _with_code(
+    kwargs: dict, sources: t.Optional[t.Dict[str, str]], file: str
+) -> dict:
+    if sources and file in sources:
+        return {**kwargs, 'code': sources.pop(file)}
+    return kwargs
+
+
+def _describe_exit(code: int) -> str:
+    if code is not None and code < 0:
+        try:
+            name = signal.Signals(-code).name
+        except ValueError:
+            name = f'signal {-code}'
+        return f'worker killed by {name}'
+    return f'worker exited with code {code}'
+
+
+def _init_worker(
+    func_name: str,
+    kwargs: dict,
+    profile: bool,
+    cache_location: t.Tuple[t.Optional[str], str],
+    backend: t.Tuple[str, t.Optional[backends.Backend]],
+    flags: t.Dict[str, bool],
+) -> None:
+    from . import formatter
+    
+    if profile:
+        profiler.enable()
+    name, backend_ = backend
+    if backend_ and name not in backends._backends:
+        backends._backends[name] = backend_
+    for k, v in flags.items():
+        setattr(formatter, k, v)
+    if formatter._ndjson:
+        # stdout is for the records of the main process only.
+        lk_logger.mute()
+    # workers only read the cache (the block tables), new tables are sent -
+    # back to be saved by the main process.
+    formatter._cache.open(*cache_location)
+    _task['cache'] = formatter._cache
+    _task['func'] = getattr(formatter, func_name)
+    _task['kwargs'] = kwargs
+    formatter.warmup(kwargs.get('formatter', 'black'))
+
+
+def _work(
+    file: str, code: t.Optional[str] = None
+) -> t.Tuple[bool, t.Any, t.Optional[profiler.T.Record], t.Dict[str, str]]:
+    """
+    returns: (ok, result, profile_record, blocks)
+        result: if not ok, it's the reason of failure.
+        blocks: the block table of a large module (see `blocks`), to be -
+            saved by the main process. empty for other files.
+    """
+    kwargs = _task['kwargs']
+    if code is not None:
+        kwargs = {**kwargs, 'code': code}
+    try:
+        result = _task['func'](file, **kwargs)
+    except MemoryError:
+        return False, 'out of memory', profiler.pop(file), {}
+    except Exception as e:
+        return False, f'{type(e).__name__}: {e}', profiler.pop(file), {}
+    return True, result, profiler.pop(file), _task['cache'].get_blocks(file)
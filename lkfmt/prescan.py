@@ -0,0 +1,51 @@
+"""
+a cheap scan of the source before the pipeline, to tell which stages can -
+possibly change it.
+
+with our settings, autoflake only removes unused imports and useless `pass` -
+statements, isort only touches imports. a file with neither needs none of -
+them, which is the common case for modules that only define things.
+
+black and lk-flavored rules always run: they work on the layout of the code -
+(which black may rewrap), no flag of the source can tell they are no-op.
+"""
+import io
+import tokenize
+import typing as t
+
+
+class Scan(t.NamedTuple):
+    # both flags mean "may have", they are True if unsure.
+    imports: bool
+    passes: bool
+    
+    @property
+    def autoflake(self) -> bool:
+        return self.imports or self.passes
+    
+    @property
+    def isort(self) -> bool:
+        return self.imports
+
+
+def scan(code: str) -> Scan:
+    """
+    a substring test rules out most files, the rest are confirmed by one -
+    tokenize pass (to skip names like `important` or `password`, and words -
+    in strings and comments). the pass stops at the first import, after that -
+    no stage can be skipped anyway.
+    """
+    if 'import' not in code and 'pass' not in code:
+        return Scan(False, False)
+    passes = False
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(code).readline):
+            if tok.type == tokenize.NAME:
+                if tok.string == 'import':
+                    return Scan(True, True)
+                if tok.string == 'pass':
+                    passes = True
+    except (SyntaxError, tokenize.TokenError):
+        # let the stages raise their own errors.
+        return Scan(True, True)
+    return Scan(False, passes)
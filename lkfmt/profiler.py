@@ -0,0 +1,147 @@
+"""
+per-stage timing of the formatting pipeline.
+
+when enabled (`fmt_all(profile=True)`), every stage of every file is timed -
+and recorded here. worker processes of `parallel` send their records back -
+with the results, so the report covers all files no matter how many jobs -
+are used.
+
+stages: read, cache (digest), prescan, autoflake, isort, -
+black/autopep8/yapf, lkflavored, write, stat_changes.
+"""
+import os
+import time
+import typing as t
+from collections import defaultdict
+from contextlib import contextmanager
+
+from lk_utils import dumps
+
+
+class T:
+    Record = t.Dict[str, float]  # {stage: seconds}
+
+
+_enabled = False
+_records: t.Dict[str, T.Record] = defaultdict(dict)
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+    _records.clear()
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+@contextmanager
+def timer(file: str, stage: str) -> t.Iterator[None]:
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add(file, stage, time.perf_counter() - start)
+
+
+def timed(
+    file: str, stages: t.Iterator[t.Tuple[str, str]]
+) -> t.Iterator[t.Tuple[str, str]]:
+    """
+    wrap the `(stage, code)` iterator of `formatter._pipeline`, record how -
+    long each stage takes to be yielded.
+    """
+    if not _enabled:
+        return stages
+    
+    def wrapped() -> t.Iterator[t.Tuple[str, str]]:
+        start = time.perf_counter()
+        for stage, code in stages:
+            _add(file, stage, time.perf_counter() - start)
+            yield stage, code
+            start = time.perf_counter()
+    
+    return wrapped()
+
+
+def get(file: str) -> t.Optional[T.Record]:
+    return _records.get(file)
+
+
+def pop(file: str) -> t.Optional[T.Record]:
+    return _records.pop(file, None)
+
+
+def collect(file: str, record: t.Optional[T.Record]) -> None:
+    """
+    merge a record from a worker process.
+    """
+    if record:
+        for stage, seconds in record.items():
+            _add(file, stage, seconds)
+
+
+def summary(root: str = None) -> dict:
+    """
+    returns: {'total': {stage: seconds}, 'files': {file: {stage: seconds}}}
+        stages are sorted by time, descending. if root is given, files are -
+        relative to it.
+    """
+    total = defaultdict(float)
+    for record in _records.values():
+        for stage, seconds in record.items():
+            total[stage] += seconds
+    return {
+        'total': dict(sorted(total.items(), key=lambda x: x[1], reverse=True)),
+        'files': {
+            (os.path.relpath(f, root) if root else f): record
+            for f, record in _records.items()
+        },
+    }
+
+
+def report(root: str = None, top: int = 10) -> None:
+    data = summary(root)
+    if not data['files']:
+        print('[yellow dim]no profile record[/]', ':r')
+        return
+    total_time = sum(data['total'].values())
+    print(
+        ':r',
+        '[cyan]time per stage ({} files):[/]'.format(len(data['files'])),
+    )
+    for stage, seconds in data['total'].items():
+        print(
+            ':r',
+            '    {:<14} {:>9.3f}s  {:>5.1f}%'.format(
+                stage, seconds, seconds / total_time * 100
+            ),
+        )
+    
+    slowest = sorted(
+        data['files'].items(), key=lambda x: sum(x[1].values()), reverse=True
+    )[:top]
+    width = min(60, max(len(f) for f, _ in slowest))
+    print(':r', f'[cyan]top {len(slowest)} slowest files:[/]')
+    for f, record in slowest:
+        stage, seconds = max(record.items(), key=lambda x: x[1])
+        print(
+            ':r',
+            '    {}  {:>8.3f}s  [dim](mostly {}: {:.3f}s)[/]'.format(
+                f.ljust(width), sum(record.values()), stage, seconds
+            ),
+        )
+
+
+def dump(file: str, root: str = None) -> None:
+    dumps({'version': 1, **summary(root)}, file, 'json')
+    print(f'[green dim]profile saved to {file}[/]', ':r')
+
+
+def _add(file: str, stage: str, seconds: float) -> None:
+    record = _records[file]
+    record[stage] = record.get(stage, 0) + seconds
@@ -0,0 +1,90 @@
+"""
+range formatting: only reformat the top-level statements that overlap the -
+given line ranges, the rest of the file stays byte-identical.
+
+a top-level statement is formatted on its own (as if it were a module), so -
+autoflake and isort are not run in this mode: they need the whole module to -
+decide what to remove or where to move.
+"""
+import ast
+import typing as t
+
+
+class T:
+    Range = t.Tuple[int, int]  # 1-based line numbers, both ends inclusive.
+    Ranges = t.List[Range]
+
+
+def parse_ranges(spec: str) -> T.Ranges:
+    """
+    e.g. '10-20,35' -> [(10, 20), (35, 35)]
+    """
+    out = []
+    for part in spec.split(','):
+        start, _, end = part.strip().partition('-')
+        start = int(start)
+        end = int(end) if end else start
+        if not 0 < start <= end:
+            raise ValueError(f'invalid line range: {part}')
+        out.append((start, end))
+    return out
+
+
+def fmt_ranges(
+    code: str, ranges: T.Ranges, format_block: t.Callable[[str], str]
+) -> str:
+    """
+    params:
+        format_block: takes the source of a top-level statement (or several -
+            ones sharing lines), returns the formatted source.
+    """
+    lines = _split_lines(code)
+    out = []
+    pos = 0
+    for start, end in select_blocks(top_level_blocks(code), ranges):
+        out.extend(lines[pos : start - 1])
+        out.append(format_block(''.join(lines[start - 1 : end])))
+        pos = end
+    out.extend(lines[pos:])
+    return ''.join(out)
+
+
+def top_level_blocks(code: str) -> T.Ranges:
+    """
+    line spans of the top-level statements, decorators included. statements -
+    sharing a line (e.g. `a = 1; b = 2`) are merged into one span.
+    """
+    out = []
+    for node in ast.parse(code).body:
+        start = min(
+            (
+                node.lineno,
+                *(x.lineno for x in getattr(node, 'decorator_list', ())),
+            )
+        )
+        end = node.end_lineno
+        if out and start <= out[-1][1]:
+            out[-1] = (out[-1][0], max(end, out[-1][1]))
+        else:
+            out.append((start, end))
+    return out
+
+
+def select_blocks(blocks: T.Ranges, ranges: T.Ranges) -> T.Ranges:
+    return [
+        (b0, b1)
+        for b0, b1 in blocks
+        if any(r0 <= b1 and b0 <= r1 for r0, r1 in ranges)
+    ]
+
+
+def _split_lines(code: str) -> t.List[str]:
+    """
+    split by '\\n' only (`str.splitlines` also splits on form feeds etc.), to -
+    stay in line with the line numbers of `ast`.
+    """
+    lines = code.split('\n')
+    out = [x + '\n' for x in lines[:-1]]
+    if lines[-1]:
+        out.append(lines[-1])
+    return out
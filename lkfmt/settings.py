@@ -0,0 +1,112 @@
+"""
+pre-defined options for the underlying formatters.
+
+this module must stay cheap to import (no third-party import here), because -
+the cache fingerprint is computed from it before any formatter is loaded.
+"""
+import typing as t
+
+# the files to format when walking a dir (or selecting changed files by git).
+SUFFIXES: t.Tuple[str, ...] = ('.py',)
+# jupyter notebooks, their code cells are formatted (see `notebook`). they -
+# are added to `SUFFIXES` by `fmt_all(notebooks=True)`. a notebook given as -
+# the target is formatted anyway.
+NOTEBOOK_SUFFIXES: t.Tuple[str, ...] = ('.ipynb',)
+
+# dirs (or files) that are never walked into, matched against the name and the -
+# path relative to the root. black's default `--exclude` plus `node_modules`.
+EXCLUDE: t.Tuple[str, ...] = (
+    '.direnv',
+    '.eggs',
+    '.git',
+    '.hg',
+    '.ipynb_checkpoints',
+    '.lkfmt_cache',
+    '.mypy_cache',
+    '.nox',
+    '.pytest_cache',
+    '.ruff_cache',
+    '.svn',
+    '.tox',
+    '.venv',
+    '.vscode',
+    '__pypackages__',
+    '_build',
+    'buck-out',
+    'build',
+    'dist',
+    'node_modules',
+    'venv',
+)
+
+# the cache database (see `cache.Cache`) evicts records not used for this many -
+# days, and the least recently used ones beyond this many.
+CACHE_MAX_AGE: float = 30
+CACHE_MAX_ENTRIES: int = 200_000
+
+AUTOFLAKE: t.Dict[str, t.Any] = {
+    'remove_all_unused_imports': True,
+    'ignore_pass_statements': False,
+    'ignore_pass_after_docstring': False,
+}
+
+ISORT: t.Dict[str, t.Any] = {
+    'case_sensitive': True,
+    'force_single_line': True,
+    'line_length': 80,
+    'only_modified': True,
+    'profile': 'black',
+    'reverse_relative': True,
+}
+
+AUTOPEP8: t.Dict[str, t.Any] = {
+    'experimental': True,
+    'max_line_length': 80,
+}
+
+BLACK: t.Dict[str, t.Any] = {
+    'line_length': 80,
+    'string_normalization': False,
+    'magic_trailing_comma': True,
+    'preview': True,
+}
+
+# ref: yapf.yapflib.style._STYLE_HELP
+YAPF: t.Dict[str, t.Any] = {
+    'ALIGN_CLOSING_BRACKET_WITH_VISUAL_INDENT': True,
+    'ALLOW_MULTILINE_DICTIONARY_KEYS': True,
+    'ALLOW_MULTILINE_LAMBDAS': True,
+    'ALLOW_SPLIT_BEFORE_DEFAULT_OR_NAMED_ASSIGNS': True,
+    'ALLOW_SPLIT_BEFORE_DICT_VALUE': True,
+    'ARITHMETIC_PRECEDENCE_INDICATION': True,
+    'BLANK_LINE_BEFORE_NESTED_CLASS_OR_DEF': True,
+    'COALESCE_BRACKETS': True,
+    'COLUMN_LIMIT': 80,
+    'DEDENT_CLOSING_BRACKETS': True,
+    'DISABLE_ENDING_COMMA_HEURISTIC': False,
+    'EACH_DICT_ENTRY_ON_SEPARATE_LINE': True,
+    'FORCE_MULTILINE_DICT': False,
+    'INDENT_BLANK_LINES': True,
+    'INDENT_CLOSING_BRACKETS': False,
+    'INDENT_DICTIONARY_VALUE': True,
+    'JOIN_MULTIPLE_LINES': True,
+    'NO_SPACES_AROUND_SELECTED_BINARY_OPERATORS': True,
+    'SPACE_BETWEEN_ENDING_COMMA_AND_CLOSING_BRACKET': False,
+    'SPACES_BEFORE_COMMENT': 2,
+    'SPLIT_ARGUMENTS_WHEN_COMMA_TERMINATED': True,
+    'SPLIT_BEFORE_ARITHMETIC_OPERATOR': True,
+    'SPLIT_BEFORE_BITWISE_OPERATOR': True,
+    'SPLIT_BEFORE_CLOSING_BRACKET': False,
+    'SPLIT_BEFORE_DICT_SET_GENERATOR': True,
+    'SPLIT_BEFORE_DOT': True,
+    'SPLIT_BEFORE_EXPRESSION_AFTER_OPENING_PAREN': True,
+    'SPLIT_BEFORE_FIRST_ARGUMENT': True,
+    'SPLIT_BEFORE_LOGICAL_OPERATOR': False,
+    'SPLIT_COMPLEX_COMPREHENSION': True,
+}
+
+# black mode for re-formatting heavy lines in `lkflavored.no_heavy_single_line`.
+BLACK_HEAVY_LINE: t.Dict[str, t.Any] = {
+    **BLACK,
+    'line_length': 50,
+}
@@ -0,0 +1,202 @@
+"""
+split the files of `fmt_all` into N stable shards, to run on N machines.
+
+a file goes to a shard by the hash of its path relative to the root, so every -
+machine (with the same checkout) picks the same subset without talking to -
+each other. with `by='size'`, files are instead dealt out by size (largest -
+first, to the least loaded shard), which balances better when a few huge -
+files dominate, but the whole file list must be walked first.
+
+each shard can save a json report (see `dump_report`), `merge_reports` -
+combines them into one summary.
+"""
+import heapq
+import os
+import typing as t
+
+from lk_utils import dumps
+from lk_utils import fs
+from lk_utils import loads
+
+from .cache import _hash
+
+
+class T:
+    Shard = t.Tuple[int, int]  # (index, total), index is 1-based.
+    # file -> [insertions, updates, deletions] in fmt mode, or whether the -
+    #   file would be reformatted in check mode.
+    Entries = t.Dict[str, t.Union[t.List[int], bool]]
+    Report = t.Dict[str, t.Any]
+
+
+def parse_shard(spec: str) -> T.Shard:
+    """
+    e.g. '2/4' -> (2, 4)
+    """
+    index, _, total = spec.partition('/')
+    try:
+        index, total = int(index), int(total)
+    except ValueError:
+        raise ValueError(f'invalid shard: {spec}, expect "i/N", e.g. "1/4"')
+    if not 0 < index <= total:
+        raise ValueError(f'invalid shard: {spec}, expect 1 <= i <= N')
+    return index, total
+
+
+def select(
+    files: t.Iterable[str],
+    root: str,
+    shard: T.Shard,
+    by: t.Literal['path', 'size'] = 'path',
+) -> t.Iterable[str]:
+    """
+    returns: the files in the shard. for `by='path'` it's an iterator, files -
+        are streamed through.
+    """
+    index, total = shard
+    if by == 'path':
+        return (
+            f
+            for f in files
+            if int(_hash(_relpath(f, root)), 16) % total == index - 1
+        )
+    if by != 'size':
+        raise ValueError(by)
+    sized = sorted(
+        ((os.path.getsize(f), _relpath(f, root), f) for f in files),
+        key=lambda x: (-x[0], x[1]),
+    )
+    loads_ = [(0, i) for i in range(total)]  # (total size, shard index)
+    out = []
+    for size, _, f in sized:
+        load, i = heapq.heappop(loads_)
+        if i == index - 1:
+            out.append(f)
+        heapq.heappush(loads_, (load + size, i))
+    return out
+
+
+def dump_report(
+    file: str,
+    root: str,
+    shard: t.Optional[T.Shard],
+    check: bool,
+    entries: T.Entries,
+    failures: t.List[t.Tuple[str, str]],
+) -> None:
+    """
+    params:
+        entries: dict[abspath, ...], see `T.Entries`.
+    """
+    dumps(
+        {
+            'version': 1,
+            'shard': '{}/{}'.format(*shard) if shard else None,
+            'check': check,
+            'files': {_relpath(f, root): v for f, v in entries.items()},
+            'failures': [
+                {'file': _relpath(f, root), 'reason': r} for f, r in failures
+            ],
+        },
+        file,
+        'json',
+    )
+    print(f'[dim]report saved to {file}[/]', ':r')
+
+
+def merge_reports(files: t.Iterable[str]) -> T.Report:
+    """
+    merge the reports of shards into one, in the same format plus a `shards` -
+    field (list of the merged shards).
+    warns about missing shards and files that appear in more than one shard.
+    """
+    merged = {
+        'version': 1,
+        'shard': None,
+        'shards': [],
+        'check': False,
+        'files': {},
+        'failures': [],
+    }
+    totals = set()
+    for file in files:
+        report = loads(file, 'json')
+        if report.get('version') != 1:
+            raise ValueError(f'unsupported report: {file}')
+        if report['shard']:
+            merged['shards'].append(report['shard'])
+            totals.add(int(report['shard'].split('/')[1]))
+        merged['check'] |= report['check']
+        for f, v in report['files'].items():
+            if f in merged['files']:
+                print(f'[yellow]{f} is in more than one shard[/]', ':r')
+            merged['files'][f] = v
+        merged['failures'].extend(report['failures'])
+    
+    if len(totals) > 1:
+        print(
+            f'[yellow]reports are from different shard counts: {totals}[/]',
+            ':r',
+        )
+    elif totals:
+        total = totals.pop()
+        if missing := sorted(
+            set(range(1, total + 1)) -
+            {int(x.split('/')[0]) for x in merged['shards']}
+        ):  # fmt:skip
+            print(
+                '[yellow]missing shards: {}[/]'.format(
+                    ', '.join(f'{i}/{total}' for i in missing)
+                ),
+                ':r',
+            )
+    return merged
+
+
+def summarize(report: T.Report) -> t.Tuple[int, int]:
+    """
+    print a summary of a (merged) report.
+    
+    returns: (count of changed files, count of failures)
+        in check mode, "changed" means "would be reformatted".
+    """
+    from .formatter import _markup_changes
+    
+    files = report['files']
+    changed = sorted(f for f, v in files.items() if _is_changed(v))
+    failures = report['failures']
+    print(
+        ':r',
+        '[cyan]{} files in {} shards[/]'.format(
+            len(files), len(report.get('shards') or [report['shard']])
+        ),
+    )
+    if report['check']:
+        for f in changed:
+            print(f'[yellow]would reformat: {f}[/]', ':r')
+        print(f'[cyan]{len(changed)} files would be reformatted[/]', ':r')
+    else:
+        i, u, d = (
+            sum(v[k] for v in files.values() if not isinstance(v, bool))
+            for k in range(3)
+        )
+        print(
+            ':r',
+            '[cyan]{} files changed:[/] {}'.format(
+                len(changed), _markup_changes((i, u, d))
+            ),
+        )
+    for x in failures:
+        print(
+            ':r',
+            '[red]failed: {}[/] [dim]({})[/]'.format(x['file'], x['reason']),
+        )
+    return len(changed), len(failures)
+
+
+def _is_changed(value: t.Union[t.List[int], bool]) -> bool:
+    return value if isinstance(value, bool) else any(value)
+
+
+def _relpath(file: str, root: str) -> str:
+    return fs.relpath(file, root).replace(os.sep, '/')
@@ -0,0 +1,179 @@
+"""
+select target files by asking local git, instead of walking the file tree.
+
+the cost of `--since` and `--staged` scales with the size of the change, not -
+the size of the repo: we only run `git diff --name-only` and read the blobs -
+that are listed.
+"""
+import os
+import re
+import subprocess
+import typing as t
+
+from . import settings
+
+_re_hunk = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@', re.M)
+
+
+def find_changed_files(
+    target: str = '.',
+    since: str = None,
+    staged: bool = False,
+    suffixes: t.Tuple[str, ...] = settings.SUFFIXES,
+) -> t.Tuple[str, t.List[str]]:
+    """
+    params:
+        target: a dir or file inside a git repo, it's used as pathspec.
+        since: a git ref. select files that differ from it in the working -
+            tree, plus untracked (not ignored) files.
+        staged: select files that are added to the index.
+        suffixes: select files ending with one of them.
+    returns: (root, files)
+        root: the top level dir of the git repo.
+        files: absolute paths of the changed python files. deleted files are -
+            not included.
+    """
+    if bool(since) == bool(staged):
+        raise ValueError('either `since` or `staged` should be given')
+    target = os.path.realpath(target)
+    root = _git(
+        target if os.path.isdir(target) else os.path.dirname(target),
+        'rev-parse',
+        '--show-toplevel',
+    ).strip()
+    if staged:
+        out = _git(
+            root,
+            'diff',
+            '--cached',
+            '--name-only',
+            '--diff-filter=ACMR',
+            '-z',
+            '--',
+            target,
+        )
+    else:
+        out = _git(
+            root,
+            'diff',
+            '--name-only',
+            '--diff-filter=ACMR',
+            '-z',
+            since,
+            '--',
+            target,
+        )
+        out += _git(
+            root,
+            'ls-files',
+            '--others',
+            '--exclude-standard',
+            '-z',
+            '--',
+            target,
+        )
+    return root, [
+        os.path.join(root, x) for x in out.split('\0') if x.endswith(suffixes)
+    ]
+
+
+def changed_lines(
+    target: str = '.', since: str = 'HEAD'
+) -> t.Tuple[str, t.Dict[str, t.Optional[t.List[t.Tuple[int, int]]]]]:
+    """
+    the changed line ranges of python files, from `git diff -U0 <since>`.
+    
+    returns: (root, {file: ranges})
+        ranges: 1-based, both ends inclusive. None for untracked files, -
+            which means the whole file.
+    """
+    # line ranges of a notebook are lines of json, not of code.
+    root, files = find_changed_files(target, since, suffixes=('.py',))
+    out = {f: None for f in files}
+    diff = _git(
+        root,
+        '-c',
+        'core.quotePath=off',
+        'diff',
+        '-U0',
+        '--no-color',
+        '--no-ext-diff',
+        since,
+        '--',
+        os.path.realpath(target),
+    )
+    for chunk in diff.split('\n+++ b/')[1:]:
+        path, _, hunks = chunk.partition('\n')
+        file = os.path.join(root, path)
+        if file not in out:
+            continue
+        ranges = []
+        for m in _re_hunk.finditer(hunks):
+            start = int(m.group(1))
+            count = int(m.group(2) or 1)
+            if count:
+                ranges.append((start, start + count - 1))
+            else:
+                # lines are deleted after `start`, take the neighbours.
+                ranges.append((max(start, 1), start + 1))
+        out[file] = ranges
+    return root, out
+
+
+def read_staged(root: str, files: t.Iterable[str]) -> t.Dict[str, str]:
+    """
+    read the staged content of files in one `git cat-file --batch` call.
+    
+    returns: dict[file, code]
+    """
+    files = tuple(files)
+    out = subprocess.run(
+        ('git', 'cat-file', '--batch'),
+        cwd=root,
+        input=''.join(':{}\n'.format(_relpath(f, root)) for f in files).encode(
+            'utf-8'
+        ),
+        capture_output=True,
+        check=True,
+    ).stdout
+    sources = {}
+    pos = 0
+    for f in files:
+        # each entry: b'<sha> blob <size>\n<content>\n'
+        end = out.index(b'\n', pos)
+        size = int(out[pos:end].split()[2])
+        sources[f] = out[end + 1 : end + 1 + size].decode('utf-8')
+        pos = end + 1 + size + 1
+    return sources
+
+
+def write_staged(root: str, file: str, code: str) -> None:
+    """
+    replace the staged content of `file` with `code`. the working tree is -
+    not touched.
+    """
+    path = _relpath(file, root)
+    mode = _git(root, 'ls-files', '--stage', '--', path).split()[0]
+    sha = _git(
+        root, 'hash-object', '-w', '--stdin', '--path', path, input=code
+    ).strip()
+    _git(root, 'update-index', '--cacheinfo', f'{mode},{sha},{path}')
+
+
+def _git(cwd: str, *args: str, input: str = None) -> str:
+    proc = subprocess.run(
+        ('git', *args),
+        cwd=cwd,
+        input=input,
+        capture_output=True,
+        encoding='utf-8',
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(
+            'git {} failed: {}'.format(args[0], proc.stderr.strip())
+        )
+    return proc.stdout
+
+
+def _relpath(file: str, root: str) -> str:
+    return os.path.relpath(file, root).replace(os.sep, '/')
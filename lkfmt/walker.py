@@ -0,0 +1,227 @@
+"""
+an `os.scandir` based file walker which prunes ignored dirs before entering -
+them.
+
+a dir is skipped if it matches one of the exclude globs (see -
+`settings.EXCLUDE`) or the `.gitignore` rules. `.gitignore` files are read -
+from the root up to the top of the git repo, and from every dir we descend -
+into; deeper rules take precedence, like git does.
+
+the supported `.gitignore` syntax: comments, blank lines, `!` negation, -
+trailing `/` (dirs only), leading or middle `/` (anchored), `*`, `?`, `[...]` -
+and `**`. `.git/info/exclude` and the global excludes file are not read.
+"""
+import os
+import re
+import typing as t
+from fnmatch import translate
+
+from . import settings
+
+
+class T:
+    # (regex, negative, dir_only)
+    Rule = t.Tuple[t.Pattern, bool, bool]
+    # (rules, strip, lead). an entry's path relative to the `.gitignore` -
+    #   file is `lead + rel[strip:]`, where `rel` is relative to the root.
+    RuleSet = t.Tuple[t.List[Rule], int, str]
+
+
+def walk(
+    root: str,
+    recursive: bool = True,
+    exclude: t.Iterable[str] = settings.EXCLUDE,
+    gitignore: bool = True,
+    dirs: bool = False,
+    suffixes: t.Tuple[str, ...] = settings.SUFFIXES,
+) -> t.Iterator[str]:
+    """
+    params:
+        dirs: yield the dirs that would be walked into (root included) -
+            instead of the files.
+        suffixes: only yield files ending with one of them.
+    yields: absolute paths of the files, as soon as they are found.
+        files of a dir come before its subdirs, both sorted by name.
+    """
+    root = os.path.abspath(root)
+    exclude = tuple(exclude)
+    excluded = (
+        re.compile('|'.join(map(translate, exclude))).match
+        if exclude
+        else (lambda _: None)
+    )
+    rulesets = _load_parent_rules(root) if gitignore else []
+    yield from _walk(
+        root, '', rulesets, excluded, recursive, gitignore, dirs, suffixes
+    )
+
+
+def is_ignored(
+    path: str,
+    exclude: t.Iterable[str] = settings.EXCLUDE,
+    gitignore: bool = True,
+) -> bool:
+    """
+    check a single path the way `walk` checks the entries of its parent dir. -
+    the dirs above are not checked (a file in an ignored dir is not ignored -
+    by itself), and exclude globs are matched against the name only.
+    """
+    path = os.path.abspath(path)
+    parent, name = os.path.split(path)
+    if (exclude := tuple(exclude)) and re.match(
+        '|'.join(map(translate, exclude)), name
+    ):
+        return True
+    if not gitignore:
+        return False
+    rulesets = _load_parent_rules(parent)
+    if rules := _read_gitignore(parent):
+        rulesets.append((rules, 0, ''))
+    return _is_ignored(rulesets, name, os.path.isdir(path))
+
+
+def _walk(
+    path: str,
+    rel: str,
+    rulesets: t.List[T.RuleSet],
+    excluded: t.Callable[[str], t.Any],
+    recursive: bool,
+    gitignore: bool,
+    dirs: bool,
+    suffixes: t.Tuple[str, ...],
+) -> t.Iterator[str]:
+    if gitignore and (rules := _read_gitignore(path)):
+        rulesets = rulesets + [(rules, len(rel) + 1 if rel else 0, '')]
+    if dirs: yield path
+    try:
+        entries = sorted(os.scandir(path), key=lambda e: e.name)
+    except OSError:
+        return
+    
+    subdirs = []
+    for entry in entries:
+        entry_rel = f'{rel}/{entry.name}' if rel else entry.name
+        is_dir = entry.is_dir(follow_symlinks=False)
+        if not is_dir and not entry.name.endswith(suffixes):
+            continue
+        if excluded(entry.name) or excluded(entry_rel):
+            continue
+        if rulesets and _is_ignored(rulesets, entry_rel, is_dir):
+            continue
+        if is_dir:
+            if recursive:
+                subdirs.append((entry.path, entry_rel))
+        elif not dirs and entry.is_file():
+            yield entry.path
+    for sub_path, sub_rel in subdirs:
+        yield from _walk(
+            sub_path,
+            sub_rel,
+            rulesets,
+            excluded,
+            recursive,
+            gitignore,
+            dirs,
+            suffixes,
+        )
+
+
+def _is_ignored(rulesets: t.List[T.RuleSet], rel: str, is_dir: bool) -> bool:
+    ignored = False
+    for rules, strip, lead in rulesets:
+        path = lead + rel[strip:]
+        for regex, negative, dir_only in rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(path):
+                ignored = not negative
+    return ignored
+
+
+# -----------------------------------------------------------------------------
+# .gitignore parsing
+
+
+def _load_parent_rules(root: str) -> t.List[T.RuleSet]:
+    """
+    collect `.gitignore` rules from the parent dirs of root, up to the top of -
+    the git repo. if root is not in a git repo, returns an empty list.
+    """
+    if os.path.exists(os.path.join(root, '.git')): return []
+    parents = []
+    path = os.path.dirname(root)
+    while True:
+        parents.append(path)
+        if os.path.exists(os.path.join(path, '.git')): break
+        if (parent := os.path.dirname(path)) == path:
+            return []  # not a git repo.
+        path = parent
+    
+    rulesets = []
+    for path in reversed(parents):
+        if rules := _read_gitignore(path):
+            lead = os.path.relpath(root, path).replace(os.sep, '/') + '/'
+            rulesets.append((rules, 0, lead))
+    return rulesets
+
+
+def _read_gitignore(path: str) -> t.List[T.Rule]:
+    try:
+        with open(os.path.join(path, '.gitignore'), encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    except (OSError, UnicodeDecodeError):
+        return []
+    return [x for line in lines if (x := _parse_rule(line))]
+
+
+def _parse_rule(line: str) -> t.Optional[T.Rule]:
+    if line.endswith(' ') and not line.endswith('\\ '):
+        line = line.rstrip(' ')
+    if not line or line.startswith('#'): return None
+    negative = line.startswith('!')
+    if negative:
+        line = line[1:]
+    elif line.startswith(('\\!', '\\#')):
+        line = line[1:]
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line: return None
+    anchored = '/' in line
+    line = line.lstrip('/')
+    pattern = _translate(line)
+    if not anchored:
+        pattern = '(?:.*/)?' + pattern
+    return re.compile(pattern + r'\Z', re.S), negative, dir_only
+
+
+def _translate(glob: str) -> str:
+    out = []
+    i, n = 0, len(glob)
+    while i < n:
+        c = glob[i]
+        if c == '*':
+            if glob.startswith('**/', i):
+                out.append('(?:.*/)?')
+                i += 3
+                continue
+            if glob.startswith('**', i):
+                out.append('.*')
+                i += 2
+                continue
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[' and (j := glob.find(']', i + 2)) != -1:
+            body = glob[i + 1 : j]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            out.append('[{}]'.format(body.replace('\\', '\\\\')))
+            i = j + 1
+            continue
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(glob[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
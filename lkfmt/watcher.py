@@ -0,0 +1,224 @@
+"""
+watch a dir and reformat python files as they are saved.
+
+like the daemon, the process stays alive: formatters are imported and the -
+cache is loaded only once. file events come from inotify on linux (through -
+ctypes, no third-party dependency), other platforms fall back to polling the -
+mtime of the walked files.
+
+a burst of events (an editor saving several files, a tool writing a file in -
+chunks) is debounced: the touched files are formatted as one batch once no -
+new event comes in for `debounce` seconds.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+import typing as t
+
+from lk_utils import fs
+
+from . import settings
+from . import walker
+
+# ref: /usr/include/linux/inotify.h
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_event_header = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+class T:
+    Files = t.Set[str]  # absolute paths of touched python files.
+
+
+def watch(
+    root: str = '.',
+    exclude: t.Iterable[str] = (),
+    debounce: float = 0.2,
+    poll: bool = False,
+    interval: float = 1.0,
+) -> None:
+    """
+    params:
+        exclude: globs in addition to `settings.EXCLUDE`.
+        debounce: seconds without new events before a batch is formatted.
+        poll: use polling even if inotify is available.
+        interval: seconds between two scans in polling mode.
+    """
+    from . import formatter
+    
+    # a source (`Inotify` or `Poller`) has `read(timeout) -> files`, where -
+    # timeout None means blocking until some files are touched, and an empty -
+    # set is returned if nothing is touched within the timeout.
+    root = fs.abspath(root)
+    exclude = (*settings.EXCLUDE, *exclude)
+    source = None
+    if not poll and sys.platform.startswith('linux'):
+        try:
+            source = Inotify(root, exclude)
+        except OSError as e:
+            print(f'[yellow]inotify is not available ({e}), polling[/]', ':r')
+    if source is None:
+        source = Poller(root, exclude, interval)
+    
+    formatter.warmup()
+    formatter._cache.bind(root)
+    print(f'[green]watching {root} ({source.name}), ctrl+c to stop[/]', ':r')
+    try:
+        while True:
+            files = source.read(None)
+            while more := source.read(debounce):
+                files |= more
+            _fmt_batch(root, files)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        source.close()
+        print('[dim]stopped watching[/]', ':r')
+
+
+class Inotify:
+    name = 'inotify'
+    _mask = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+    
+    def __init__(self, root: str, exclude: t.Tuple[str, ...]) -> None:
+        self._exclude = exclude
+        self._libc = ctypes.CDLL(
+            ctypes.util.find_library('c') or 'libc.so.6', use_errno=True
+        )
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._dirs: t.Dict[int, str] = {}  # dict[watch_descriptor, dir]
+        try:
+            for d in walker.walk(root, exclude=exclude, dirs=True):
+                self._add_watch(d)
+        except OSError:
+            self.close()
+            raise
+    
+    def read(self, timeout: t.Optional[float]) -> T.Files:
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return set()
+        data = os.read(self._fd, 64 * 1024)
+        out = set()
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, size = _event_header.unpack_from(data, pos)
+            name = data[pos + 16 : pos + 16 + size].rstrip(b'\0')
+            pos += 16 + size
+            if mask & _IN_Q_OVERFLOW:
+                print('[yellow]too many events, some files are missed[/]', ':r')
+                continue
+            if mask & _IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            if (parent := self._dirs.get(wd)) is None or not name:
+                continue
+            path = os.path.join(parent, os.fsdecode(name))
+            if mask & _IN_ISDIR:
+                if walker.is_ignored(path, self._exclude):
+                    continue
+                # files may be written into a new dir before it's watched.
+                for d in walker.walk(path, exclude=self._exclude, dirs=True):
+                    try:
+                        self._add_watch(d)
+                    except OSError as e:
+                        print(f'[yellow]cannot watch {d}: {e}[/]', ':r')
+                out.update(walker.walk(path, exclude=self._exclude))
+            elif (
+                mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO) and
+                path.endswith(settings.SUFFIXES) and
+                not walker.is_ignored(path, self._exclude)
+            ):  # fmt:skip
+                out.add(path)
+        return out
+    
+    def close(self) -> None:
+        os.close(self._fd)
+    
+    def _add_watch(self, path: str) -> None:
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(path), self._mask
+        )
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        self._dirs[wd] = path
+
+
+class Poller:
+    name = 'polling'
+    
+    def __init__(
+        self, root: str, exclude: t.Tuple[str, ...], interval: float
+    ) -> None:
+        self._exclude = exclude
+        self._interval = interval
+        self._root = root
+        self._snapshot = self._scan()
+    
+    def read(self, timeout: t.Optional[float]) -> T.Files:
+        while True:
+            time.sleep(self._interval if timeout is None else timeout)
+            snapshot = self._scan()
+            out = {f for f, x in snapshot.items() if self._snapshot.get(f) != x}
+            self._snapshot = snapshot
+            if out or timeout is not None:
+                return out
+    
+    def close(self) -> None:
+        pass
+    
+    def _scan(self) -> t.Dict[str, t.Tuple[int, int]]:
+        """
+        returns: dict[file, (mtime_ns, size)]
+        """
+        out = {}
+        for f in walker.walk(self._root, exclude=self._exclude):
+            try:
+                stat = os.stat(f)
+            except OSError:
+                continue
+            out[f] = (stat.st_mtime_ns, stat.st_size)
+        return out
+
+
+def _fmt_batch(root: str, files: T.Files) -> None:
+    from . import formatter as fmt
+    
+    # our own writes come back as events too, `_filter_formatted` drops them -
+    # after one hash.
+    keys = {}
+    for f in sorted(filter(os.path.isfile, files)):
+        relpath = fs.relpath(f, root)
+        try:
+            if not tuple(fmt._filter_formatted((f,), keys)):
+                continue
+            code, changes = fmt.fmt_one(f, quiet=True)
+        except Exception as e:
+            # e.g. a syntax error in a half-written file. it will be retried -
+            # on the next save.
+            print(
+                '[red]reformat failed: {} ({}: {})[/]'.format(
+                    relpath, type(e).__name__, e
+                ),
+                ':r',
+            )
+            continue
+        fmt._cache.set(keys[f], fmt.digest(code, f))
+        print(
+            ':r',
+            '[green]reformat done: {} ({})[/]'.format(
+                relpath, fmt._markup_changes(changes)
+            ),
+        )
+    if keys:
+        fmt._cache.save()
@@ -0,0 +1,93 @@
+import importlib
+import random
+import re
+import typing as t
+from difflib import ndiff
+
+import pytest
+
+from lkfmt import diff
+
+
+def _mutate(lines: t.List[str], seed: int) -> t.List[str]:
+    """
+    what a formatter would do to some lines: re-indent, normalize spaces, -
+    explode a call, insert or delete blank lines.
+    """
+    rand = random.Random(seed)
+    out = []
+    for line in lines:
+        r = rand.random()
+        if r < 0.1:
+            continue
+        elif r < 0.2:
+            out.append('    ' + line)
+        elif r < 0.3:
+            out.append(line.replace(',', ', ').replace('=', ' = '))
+        elif r < 0.35:
+            out.append(line + '(')
+            out.append('    x,')
+            out.append(')')
+        elif r < 0.4:
+            out.append(line)
+            out.append('')
+        else:
+            out.append(line)
+    return out
+
+
+def _sample(seed: int) -> t.List[str]:
+    rand = random.Random(seed)
+    out = []
+    for i in range(rand.randint(20, 60)):
+        args = ','.join(f'a{j}={j}' for j in range(rand.randint(0, 5)))
+        out.append('def func_{}({}):'.format(i, args))
+        out.append('\treturn other_{}({})'.format(i, args))
+    return out
+
+
+def _ndiff_counts(a: str, b: str) -> diff.T.Changes:
+    insertions = updates = deletions = 0
+    for mark, _ in diff._squirsh_diffs(
+        diff._diff(a.splitlines(), b.splitlines(), engine='ndiff')
+    ):
+        if mark == '+':
+            insertions += 1
+        elif mark == '-':
+            deletions += 1
+        elif mark == '?':
+            updates += 1
+    return insertions, updates, deletions
+
+
+def _check(a: t.List[str], b: t.List[str]) -> None:
+    assert list(diff._compare(a, b)) == list(ndiff(a, b))
+    a, b = '\n'.join(a), '\n'.join(b)
+    assert diff.stat_changes(a, b) == _ndiff_counts(a, b)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_stat_changes_matches_ndiff(seed: int) -> None:
+    a = _sample(seed)
+    _check(a, _mutate(a, seed))
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_large_blocks_match_ndiff(seed: int) -> None:
+    # every line is re-indented, nothing is left as an anchor: the whole -
+    # file is one replaced block of over a hundred lines on each side.
+    a = _sample(seed) + _sample(seed + 100)
+    b = [' ' + x for x in _mutate(a, seed)]
+    _check(a, b)
+
+
+@pytest.mark.parametrize('module', ('numbers', 'string', 'timeit'))
+def test_reindented_module_matches_ndiff(module: str) -> None:
+    # a module indented by 2 spaces, then by 4. the replaced blocks are -
+    # large, and many lines are similar to each other.
+    with open(importlib.import_module(module).__file__, encoding='utf-8') as f:
+        b = f.read().splitlines()
+    a = [
+        re.sub(r'^ +', lambda m: ' ' * (len(m.group()) // 2), x) for x in b
+    ]
+    _check(a, b)